@@ -1,13 +1,55 @@
 # ref: https://testdriven.io/blog/fastapi-jwt-auth/
+from collections import OrderedDict
+from dataclasses import dataclass
+
 from fastapi import Request, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from config import SECRET_KEY, ALGORITHM
+from config import SECRET_KEY, ALGORITHM, TOKEN_CACHE_SIZE
+from .utils import normalize_address
 
 import time
 
 import jwt
 
 
+@dataclass(frozen=True, slots=True)
+class Principal:
+    wallet_address: str
+    expires: float
+
+
+class TokenCache:
+    """
+    bounded LRU of already verified tokens, entries are dropped once expired
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._principals: OrderedDict[str, Principal] = OrderedDict()
+
+    def get(self, token: str) -> Principal | None:
+        principal = self._principals.get(token)
+        if principal is None:
+            return None
+        if principal.expires < time.time():
+            del self._principals[token]
+            return None
+        self._principals.move_to_end(token)
+        return principal
+
+    def put(self, token: str, principal: Principal):
+        self._principals[token] = principal
+        self._principals.move_to_end(token)
+        if len(self._principals) > self.maxsize:
+            self._principals.popitem(last=False)
+
+    def clear(self):
+        self._principals.clear()
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+
 def decode_jwt(token: str) -> dict:
     try:
         decoded_token = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -16,11 +58,36 @@ def decode_jwt(token: str) -> dict:
         return {}
 
 
+def verify_token(token: str) -> Principal | None:
+    """
+    principal of a valid, unexpired token. the signature is only checked the
+    first time a token is seen, later calls are served from `token_cache`.
+    """
+    principal = token_cache.get(token)
+    if principal is not None:
+        return principal
+
+    payload = decode_jwt(token)
+    if not payload or "wallet_address" not in payload:
+        return None
+
+    # tokens issued before addresses were stored lowercase carry checksummed
+    # ones, the principal address is written to votes and proposals as is
+    try:
+        wallet_address = normalize_address(payload["wallet_address"])
+    except (TypeError, ValueError):
+        return None
+
+    principal = Principal(wallet_address=wallet_address, expires=payload["expires"])
+    token_cache.put(token, principal)
+    return principal
+
+
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
         super(JWTBearer, self).__init__(auto_error=auto_error)
 
-    async def __call__(self, request: Request):
+    async def __call__(self, request: Request) -> Principal:
         credentials: HTTPAuthorizationCredentials = await super(
             JWTBearer, self
         ).__call__(request)
@@ -29,35 +96,14 @@ class JWTBearer(HTTPBearer):
                 raise HTTPException(
                     status_code=403, detail="Invalid authentication scheme."
                 )
-            if not self.verify_jwt(credentials.credentials):
+            principal = verify_token(credentials.credentials)
+            if principal is None:
                 raise HTTPException(
                     status_code=403, detail="Invalid token or expired token."
                 )
-            return credentials.credentials
+            return principal
         else:
             raise HTTPException(status_code=403, detail="Invalid authorization code.")
 
-    def verify_jwt(self, jwtoken: str) -> bool:
-        isTokenValid: bool = False
 
-        try:
-            payload = decode_jwt(jwtoken)
-        except:
-            payload = None
-        if payload:
-            isTokenValid = True
-
-        return isTokenValid
-
-
-def get_wallet_from_rq(request: Request) -> str | None:
-    try:
-        token = request.headers["authorization"].split(" ")[1]
-        decoded_token = jwt.decode(
-            token,
-            SECRET_KEY,
-            algorithms=[ALGORITHM],
-        )
-        return decoded_token["wallet_address"]
-    except:
-        return None
+jwt_bearer = JWTBearer()
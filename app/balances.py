@@ -0,0 +1,264 @@
+import asyncio
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from config import (
+    BALANCE_BATCH_SIZE,
+    BALANCE_BATCH_WINDOW_SECONDS,
+    BALANCE_CACHE_SIZE,
+    BALANCE_CACHE_TTL_SECONDS,
+    BALANCE_DEADLINE_SECONDS,
+    BALANCE_PROVIDER,
+    BALANCE_RPC_URL,
+)
+
+ZERO_ADDRESS = "0x" + "0" * 40
+
+BALANCE_OF_SELECTOR = "0x70a08231"
+DECIMALS_SELECTOR = "0x313ce567"
+
+
+class BalanceUnavailable(Exception):
+    pass
+
+
+class BalanceProvider(ABC):
+    """
+    token balances of wallets, looked up many wallets at a time
+    """
+
+    @abstractmethod
+    async def get_balances(
+        self, token_address: str, wallet_addresses: list[str]
+    ) -> dict[str, float]: ...
+
+    async def get_balance(self, token_address: str, wallet_address: str) -> float:
+        balances = await self.get_balances(token_address, [wallet_address])
+        return balances[wallet_address]
+
+
+class LocalBalanceProvider(BalanceProvider):
+    """
+    in-process stand-in. balances can be set per (token, wallet), the others
+    are drawn at random like the former `fake_get_balance`.
+    """
+
+    def __init__(self, balances: dict[tuple[str, str], float] | None = None):
+        self.balances = balances if balances is not None else {}
+
+    async def get_balances(self, token_address, wallet_addresses):
+        return {
+            wallet: self.balances.get(
+                (token_address, wallet), random.uniform(100, 30_000)
+            )
+            for wallet in wallet_addresses
+        }
+
+
+class RPCBalanceProvider(BalanceProvider):
+    """
+    reads balances with one JSON-RPC batch per lookup: `balanceOf` of an
+    ERC-20, or `eth_getBalance` for the zero address. token decimals are
+    fetched once and kept.
+    """
+
+    def __init__(self, rpc_url: str):
+        self.rpc_url = rpc_url
+        self._decimals: dict[str, int] = {ZERO_ADDRESS: 18}
+        self._session = None
+
+    def _call(self, request_id: int, token_address: str, data: str) -> dict:
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "method": "eth_call",
+            "params": [{"to": token_address, "data": data}, "latest"],
+        }
+
+    async def get_balances(self, token_address, wallet_addresses):
+        if token_address == ZERO_ADDRESS:
+            batch = [
+                {
+                    "jsonrpc": "2.0",
+                    "id": i,
+                    "method": "eth_getBalance",
+                    "params": [wallet, "latest"],
+                }
+                for i, wallet in enumerate(wallet_addresses)
+            ]
+        else:
+            batch = [
+                self._call(i, token_address, BALANCE_OF_SELECTOR + wallet[2:].zfill(64))
+                for i, wallet in enumerate(wallet_addresses)
+            ]
+        if token_address not in self._decimals:
+            batch.append(self._call(len(batch), token_address, DECIMALS_SELECTOR))
+
+        if self._session is None:
+            # imported on first use, aiohttp is slow to load
+            import aiohttp
+
+            self._session = aiohttp.ClientSession()
+        async with self._session.post(self.rpc_url, json=batch) as response:
+            response.raise_for_status()
+            items = {item["id"]: item for item in await response.json()}
+
+        # a failed call is not a zero balance, nothing of this batch is cached
+        results = {}
+        for call in batch:
+            item = items.get(call["id"], {})
+            if item.get("result") is None:
+                error = item.get("error", "no result")
+                raise BalanceUnavailable(f"{call['method']} failed: {error}")
+            results[call["id"]] = item["result"]
+
+        if token_address not in self._decimals:
+            self._decimals[token_address] = int(results[len(wallet_addresses)], 16)
+        scale = 10 ** self._decimals[token_address]
+
+        return {
+            wallet: int(results[i], 16) / scale
+            for i, wallet in enumerate(wallet_addresses)
+        }
+
+
+class CachedBalanceProvider(BalanceProvider):
+    """
+    TTL/LRU cache in front of another provider, keyed by (token, wallet).
+
+    misses from concurrent requests are coalesced: they are queued per token
+    and fetched together after `batch_window` seconds or once `batch_size`
+    wallets are waiting. every lookup gives up after `deadline` seconds.
+    """
+
+    def __init__(
+        self,
+        provider: BalanceProvider,
+        ttl: float,
+        maxsize: int,
+        deadline: float,
+        batch_window: float,
+        batch_size: int,
+    ):
+        self.provider = provider
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.deadline = deadline
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+
+        self._cache: OrderedDict[tuple[str, str], tuple[float, float]] = OrderedDict()
+        self._pending: dict[tuple[str, str], asyncio.Future] = {}
+        self._queued: dict[str, list[str]] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._fetches: set[asyncio.Task] = set()
+
+    def _cache_get(self, key, now: float) -> float | None:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, balance = entry
+        if expires < now:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return balance
+
+    def _cache_put(self, key, balance: float, now: float):
+        self._cache[key] = (now + self.ttl, balance)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def _queue(self, token_address: str, wallet_address: str):
+        queued = self._queued.setdefault(token_address, [])
+        queued.append(wallet_address)
+        if len(queued) >= self.batch_size:
+            self._flush(token_address)
+        elif token_address not in self._timers:
+            self._timers[token_address] = asyncio.get_running_loop().call_later(
+                self.batch_window, self._flush, token_address
+            )
+
+    def _flush(self, token_address: str):
+        timer = self._timers.pop(token_address, None)
+        if timer is not None:
+            timer.cancel()
+        wallets = self._queued.pop(token_address, [])
+        if wallets:
+            task = asyncio.create_task(self._fetch(token_address, wallets))
+            self._fetches.add(task)
+            task.add_done_callback(self._fetches.discard)
+
+    async def _fetch(self, token_address: str, wallet_addresses: list[str]):
+        try:
+            balances = await asyncio.wait_for(
+                self.provider.get_balances(token_address, wallet_addresses),
+                self.deadline,
+            )
+        except Exception as exc:
+            for wallet in wallet_addresses:
+                future = self._pending.pop((token_address, wallet))
+                future.set_exception(BalanceUnavailable(str(exc) or type(exc).__name__))
+                # callers may have timed out already, don't warn about it
+                future.exception()
+            return
+
+        now = time.monotonic()
+        for wallet in wallet_addresses:
+            key = (token_address, wallet)
+            balance = balances.get(wallet, 0.0)
+            self._cache_put(key, balance, now)
+            self._pending.pop(key).set_result(balance)
+
+    async def get_balances(self, token_address, wallet_addresses):
+        now = time.monotonic()
+        balances = {}
+        waiting = {}
+        for wallet in wallet_addresses:
+            key = (token_address, wallet)
+            balance = self._cache_get(key, now)
+            if balance is not None:
+                balances[wallet] = balance
+                continue
+            future = self._pending.get(key)
+            if future is None:
+                future = asyncio.get_running_loop().create_future()
+                self._pending[key] = future
+                self._queue(token_address, wallet)
+            waiting[wallet] = future
+
+        if waiting:
+            try:
+                results = await asyncio.wait_for(
+                    asyncio.gather(*(asyncio.shield(f) for f in waiting.values())),
+                    self.deadline,
+                )
+            except asyncio.TimeoutError:
+                raise BalanceUnavailable(
+                    f"balance lookup exceeded {self.deadline}s deadline"
+                )
+            balances.update(zip(waiting, results))
+
+        return balances
+
+
+def create_balance_provider() -> BalanceProvider:
+    if BALANCE_PROVIDER == "rpc":
+        provider = RPCBalanceProvider(BALANCE_RPC_URL)
+    else:
+        provider = LocalBalanceProvider()
+
+    return CachedBalanceProvider(
+        provider,
+        ttl=BALANCE_CACHE_TTL_SECONDS,
+        maxsize=BALANCE_CACHE_SIZE,
+        deadline=BALANCE_DEADLINE_SECONDS,
+        batch_window=BALANCE_BATCH_WINDOW_SECONDS,
+        batch_size=BALANCE_BATCH_SIZE,
+    )
+
+
+balance_provider = create_balance_provider()
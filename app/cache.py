@@ -0,0 +1,154 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import RESPONSE_CACHE_SIZE
+from .schemas import Version, VotingStrategy
+
+LISTING_KEYS = {
+    VotingStrategy.SIMPLE: "proposals",
+    VotingStrategy.TOKEN_WEIGHT: "token_weight_proposals",
+}
+
+
+def proposal_key(proposal_id: str) -> str:
+    return f"proposal:{proposal_id}"
+
+
+async def bump_versions(session: AsyncSession, keys: list[str]) -> dict[str, int]:
+    """
+    invalidate the cached reads of `keys`, in the caller's transaction.
+    returns the new version of each key.
+    """
+    if not keys:
+        return {}
+    stmt = sqlite_insert(Version).values([{"key": key, "version": 1} for key in keys])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Version.__table__.c.key],
+        set_={"version": Version.__table__.c.version + 1},
+    ).returning(Version.key, Version.version)
+    return dict((await session.exec(stmt)).all())
+
+
+async def get_versions(session: AsyncSession, keys: list[str]) -> tuple:
+    rows = dict(
+        (
+            await session.exec(
+                select(Version.key, Version.version).where(Version.key.in_(keys))
+            )
+        ).all()
+    )
+    return tuple(rows.get(key, 0) for key in keys)
+
+
+@lru_cache
+def type_adapter(type_) -> TypeAdapter:
+    return TypeAdapter(type_)
+
+
+def dump_json(type_, value) -> bytes:
+    """
+    serialize `value` the way FastAPI would for a route returning `type_`
+    """
+    return type_adapter(type_).dump_json(value)
+
+
+def next_transition(proposals, now: float) -> float:
+    """
+    the next time the derived status of any of `proposals` changes
+    """
+    upcoming = [
+        timestamp
+        for proposal in proposals
+        for timestamp in (proposal.start_timestamp, proposal.end_timestamp)
+        if timestamp > now
+    ]
+    return min(upcoming, default=math.inf)
+
+
+@dataclass(frozen=True, slots=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: dict
+    expires: float
+
+
+class ResponseCache:
+    """
+    LRU of serialized responses. entries are keyed by the versions they were
+    built from, so a write makes them unreachable rather than deleting them.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._responses: OrderedDict[tuple, CachedResponse] = OrderedDict()
+
+    def get(self, key: tuple) -> CachedResponse | None:
+        cached = self._responses.get(key)
+        if cached is None:
+            return None
+        if cached.expires <= time.time():
+            del self._responses[key]
+            return None
+        self._responses.move_to_end(key)
+        return cached
+
+    def put(self, key: tuple, cached: CachedResponse):
+        self._responses[key] = cached
+        self._responses.move_to_end(key)
+        if len(self._responses) > self.maxsize:
+            self._responses.popitem(last=False)
+
+    def clear(self):
+        self._responses.clear()
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+async def cached_json(
+    request: Request,
+    session: AsyncSession,
+    keys: list[str],
+    build: Callable[[], Awaitable[tuple[bytes, dict, float]]],
+) -> Response:
+    """
+    conditional JSON response for a read depending on `keys`.
+
+    `build` returns the serialized body, extra headers and the time it stops
+    being valid (the next status transition). it only runs on a cache miss,
+    a matching If-None-Match gets a 304.
+    """
+    versions = await get_versions(session, keys)
+    cache_key = (request.url.path, request.url.query, versions)
+
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        body, headers, expires = await build()
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        cached = CachedResponse(body=body, etag=etag, headers=headers, expires=expires)
+        response_cache.put(cache_key, cached)
+
+    headers = {**cached.headers, "ETag": cached.etag}
+    if etag_matches(request, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
@@ -1,13 +1,340 @@
-from sqlmodel import SQLModel, create_engine
+import asyncio
+import zlib
 
+from sqlalchemy import event, inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-sqlite_file_name = "database.db"
-sqlite_url = f"sqlite:///{sqlite_file_name}"
+from config import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_READ_MAX_OVERFLOW,
+    DB_READ_POOL_SIZE,
+    SQLITE_FILE,
+    SQLITE_PROFILE,
+    SQLITE_PROFILES,
+)
+from . import schemas  # noqa: F401 register tables on SQLModel.metadata
+from .metrics import instrument_engine
+
+sqlite_url = f"sqlite+aiosqlite:///{SQLITE_FILE}"
 
 connect_args = {"check_same_thread": False}
 
-engine = create_engine(sqlite_url, connect_args=connect_args)
+
+def apply_pragmas(engine, pragmas: dict):
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+engine = create_async_engine(
+    sqlite_url,
+    connect_args=connect_args,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+)
+apply_pragmas(engine, SQLITE_PROFILES[SQLITE_PROFILE])
+instrument_engine(engine)
+
+# used by the GET routes: with WAL, readers never wait on the writer
+read_engine = create_async_engine(
+    sqlite_url,
+    connect_args=connect_args,
+    pool_size=DB_READ_POOL_SIZE,
+    max_overflow=DB_READ_MAX_OVERFLOW,
+)
+apply_pragmas(
+    read_engine,
+    {
+        # journal_mode is persisted by the writer, the rest is per connection
+        **{
+            name: value
+            for name, value in SQLITE_PROFILES[SQLITE_PROFILE].items()
+            if name != "journal_mode"
+        },
+        "query_only": "ON",
+    },
+)
+instrument_engine(read_engine)
+
+
+def migrate_indexes(conn):
+    """
+    create indexes missing from an existing database.
+
+    `create_all` only creates indexes together with new tables, so databases
+    created before an index was declared are upgraded here. Duplicate rows are
+    dropped (keeping the earliest one) before a unique index is created.
+    """
+    inspector = inspect(conn)
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if index.unique:
+                columns = ", ".join(column.name for column in index.columns)
+                conn.execute(
+                    text(
+                        f"DELETE FROM {table.name} WHERE rowid NOT IN "
+                        f"(SELECT MIN(rowid) FROM {table.name} GROUP BY {columns})"
+                    )
+                )
+            index.create(conn)
+
+
+ADDRESS_COLUMNS = {
+    "user": ["wallet_address"],
+    "proposal": ["proposer"],
+    "vote": ["voter_address"],
+}
+
+
+def migrate_lowercase_addresses(conn) -> bool:
+    """
+    v1: store addresses in their canonical lowercase form.
+
+    rows that only differed by address case collapse onto the same unique key,
+    the earliest one is kept. returns True if any vote was dropped.
+    """
+    dropped_votes = False
+    for table in SQLModel.metadata.sorted_tables:
+        address_columns = ADDRESS_COLUMNS.get(table.name)
+        if not address_columns:
+            continue
+
+        unique_keys = [[column.name for column in table.primary_key.columns]]
+        unique_keys += [
+            [column.name for column in index.columns]
+            for index in table.indexes
+            if index.unique
+        ]
+        for key in unique_keys:
+            if not set(key) & set(address_columns):
+                continue
+            group_by = ", ".join(
+                f"lower({name})" if name in address_columns else name for name in key
+            )
+            result = conn.execute(
+                text(
+                    f"DELETE FROM {table.name} WHERE rowid NOT IN "
+                    f"(SELECT MIN(rowid) FROM {table.name} GROUP BY {group_by})"
+                )
+            )
+            if result.rowcount and table.name == "vote":
+                dropped_votes = True
+
+        for name in address_columns:
+            conn.execute(
+                text(
+                    f"UPDATE {table.name} SET {name} = lower({name}) "
+                    f"WHERE {name} != lower({name})"
+                )
+            )
+    return dropped_votes
+
+
+def migrate_unified_proposals(conn) -> bool:
+    """
+    v2: token weight proposals and votes move into the `proposal` and `vote`
+    tables, told apart by `proposal.strategy`. their addresses are lowercased
+    on the way, v1 only knew about the tables still in the metadata.
+    returns True if votes were moved.
+    """
+    inspector = inspect(conn)
+    tables = inspector.get_table_names()
+    proposal_columns = {column["name"] for column in inspector.get_columns("proposal")}
+    vote_columns = {column["name"] for column in inspector.get_columns("vote")}
+
+    # enums are stored by name
+    if "strategy" not in proposal_columns:
+        conn.execute(
+            text(
+                "ALTER TABLE proposal "
+                "ADD COLUMN strategy VARCHAR(12) NOT NULL DEFAULT 'SIMPLE'"
+            )
+        )
+    if "token_address" not in proposal_columns:
+        conn.execute(text("ALTER TABLE proposal ADD COLUMN token_address VARCHAR"))
+    if "weight" not in vote_columns:
+        conn.execute(
+            text("ALTER TABLE vote ADD COLUMN weight FLOAT NOT NULL DEFAULT 1.0")
+        )
+
+    # the listing indexes now lead with the strategy
+    conn.execute(text("DROP INDEX IF EXISTS ix_proposal_created"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_proposal_proposer_created"))
+
+    if "tokenweightproposal" in tables:
+        conn.execute(
+            text(
+                "INSERT OR IGNORE INTO proposal (proposal_id, title, description, "
+                "proposer, created_timestamp, start_timestamp, end_timestamp, "
+                "status, strategy, token_address) "
+                "SELECT proposal_id, title, description, lower(proposer), "
+                "created_timestamp, start_timestamp, end_timestamp, status, "
+                "'TOKEN_WEIGHT', lower(token_address) FROM tokenweightproposal"
+            )
+        )
+        conn.execute(text("DROP TABLE tokenweightproposal"))
+
+    moved_votes = False
+    if "tokenweightvote" in tables:
+        # the earliest vote wins if lowercasing made two of them collide
+        result = conn.execute(
+            text(
+                "INSERT OR IGNORE INTO vote (vote_id, proposal_id, voter_address, "
+                "voted_timestamp, option, weight) "
+                "SELECT vote_id, proposal_id, lower(voter_address), "
+                "voted_timestamp, option, weight FROM tokenweightvote ORDER BY rowid"
+            )
+        )
+        moved_votes = bool(result.rowcount)
+        conn.execute(text("DROP TABLE tokenweightvote"))
+    return moved_votes
+
+
+def create_proposal_search(conn) -> bool:
+    """
+    v3: FTS5 index of proposal titles and descriptions, `proposal_fts`.
+
+    triggers keep it in sync with `proposal`, the existing proposals are
+    indexed once. it is keyed by `proposal_id` rather than rowid, which
+    VACUUM may renumber on a table without an INTEGER PRIMARY KEY. the
+    strategy is indexed too, so searches filter on it without a join.
+    """
+    conn.execute(
+        text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS proposal_fts USING fts5("
+            "proposal_id UNINDEXED, strategy, title, description, "
+            "prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+        )
+    )
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS proposal_fts_insert AFTER INSERT ON proposal "
+            "BEGIN INSERT INTO proposal_fts (proposal_id, strategy, title, description) "
+            "VALUES (new.proposal_id, new.strategy, new.title, new.description); END"
+        )
+    )
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS proposal_fts_update "
+            "AFTER UPDATE OF strategy, title, description ON proposal "
+            "BEGIN UPDATE proposal_fts SET strategy = new.strategy, "
+            "title = new.title, description = new.description "
+            "WHERE proposal_id = old.proposal_id; END"
+        )
+    )
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS proposal_fts_delete AFTER DELETE ON proposal "
+            "BEGIN DELETE FROM proposal_fts WHERE proposal_id = old.proposal_id; END"
+        )
+    )
+    conn.execute(text("DELETE FROM proposal_fts"))
+    conn.execute(
+        text(
+            "INSERT INTO proposal_fts (proposal_id, strategy, title, description) "
+            "SELECT proposal_id, strategy, title, description FROM proposal"
+        )
+    )
+    return False
+
+
+MIGRATIONS = [
+    migrate_lowercase_addresses,
+    migrate_unified_proposals,
+    create_proposal_search,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def run_migrations(conn) -> bool:
+    """
+    apply the data migrations newer than the `user_version` of the database.
+    returns True if the tallies have to be rebuilt.
+    """
+    version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    rebuild_tallies = False
+    for migration in MIGRATIONS[version:]:
+        rebuild_tallies |= bool(migration(conn))
+    conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return rebuild_tallies
+
+
+def schema_fingerprint() -> int:
+    """
+    crc32 of the tables, columns and indexes declared on the metadata
+    """
+    parts = []
+    for table in SQLModel.metadata.sorted_tables:
+        parts.append(table.name)
+        parts += [
+            f"{column.name}:{column.type!r}:{column.nullable}:{column.primary_key}"
+            for column in table.columns
+        ]
+        parts += sorted(
+            f"{index.name}:{[column.name for column in index.columns]}:{index.unique}"
+            for index in table.indexes
+        )
+    return zlib.crc32("\n".join(parts).encode())
+
+
+def schema_is_current(conn, fingerprint: int) -> bool:
+    """
+    whether the database was last set up by this very schema, in which case
+    startup skips `create_all`, the migrations and the index checks
+    """
+    if conn.exec_driver_sql("PRAGMA user_version").scalar() != SCHEMA_VERSION:
+        return False
+    try:
+        stored = conn.execute(
+            text("SELECT version FROM version WHERE key = 'schema'")
+        ).scalar()
+    except OperationalError:
+        return False
+    return stored == fingerprint
+
+
+def mark_schema(conn, fingerprint: int):
+    stmt = sqlite_insert(schemas.Version).values(key="schema", version=fingerprint)
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[schemas.Version.__table__.c.key],
+            set_={"version": fingerprint},
+        )
+    )
+
+
+async def create_db_and_tables():
+    from .tally import rebuild_tallies
+
+    fingerprint = schema_fingerprint()
+    async with engine.begin() as conn:
+        if await conn.run_sync(schema_is_current, fingerprint):
+            return
+        has_tally = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).has_table(schemas.Tally.__tablename__)
+        )
+        await conn.run_sync(SQLModel.metadata.create_all)
+        votes_changed = await conn.run_sync(run_migrations)
+        await conn.run_sync(migrate_indexes)
+        await conn.run_sync(mark_schema, fingerprint)
+
+    if not has_tally or votes_changed:
+        # databases from before the tally table, or whose votes were
+        # rewritten by a migration: count the existing votes once
+        async with AsyncSession(engine) as session:
+            await rebuild_tallies(session)
 
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+if __name__ == "__main__":
+    asyncio.run(create_db_and_tables())
@@ -1,13 +1,23 @@
 from typing import Annotated
 
 from fastapi import Depends
-from .database import engine
-from sqlmodel import Session
+from .auth import Principal, jwt_bearer
+from .database import engine, read_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 
-def get_session():
-    with Session(engine) as session:
+async def get_session():
+    # objects are returned after commit, keep them loaded instead of
+    # expiring them into lazy loads the event loop can't run
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+async def get_read_session():
+    async with AsyncSession(read_engine) as session:
+        yield session
+
+
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_session)]
+PrincipalDep = Annotated[Principal, Depends(jwt_bearer)]
@@ -0,0 +1,85 @@
+import asyncio
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import RESULTS_STREAM_QUEUE_SIZE
+
+PENDING_EVENTS = "pending_events"
+
+
+class Subscription:
+    def __init__(self, proposal_id: str, maxsize: int):
+        self.proposal_id = proposal_id
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize)
+        # set when events were dropped, the subscriber has to resync
+        self.lagged = False
+
+    def put(self, payload: dict):
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def resync(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.lagged = False
+
+
+class ResultsBroker:
+    """
+    in-process pub/sub of committed tally changes, one topic per proposal.
+    publishing never waits: a subscriber `maxsize` events behind is flagged
+    to resync instead of slowing down the writer.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._subscriptions: dict[str, set[Subscription]] = {}
+
+    def subscribe(self, proposal_id: str) -> Subscription:
+        subscription = Subscription(proposal_id, self.maxsize)
+        self._subscriptions.setdefault(proposal_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.proposal_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.proposal_id]
+
+    def publish(self, proposal_id: str, payload: dict):
+        for subscription in self._subscriptions.get(proposal_id, ()):
+            subscription.put(payload)
+
+    def __len__(self):
+        return sum(map(len, self._subscriptions.values()))
+
+
+results_broker = ResultsBroker(RESULTS_STREAM_QUEUE_SIZE)
+
+
+def queue_event(session, proposal_id: str, payload: dict):
+    """
+    publish `payload` once the transaction of `session` commits
+    """
+    session.sync_session.info.setdefault(PENDING_EVENTS, []).append(
+        (proposal_id, payload)
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def publish_pending_events(session):
+    for proposal_id, payload in session.info.pop(PENDING_EVENTS, ()):
+        results_broker.publish(proposal_id, payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def drop_pending_events(session):
+    session.info.pop(PENDING_EVENTS, None)
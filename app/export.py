@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import EXPORT_BATCH_SIZE
+from .database import read_engine
+from .schemas import ExportFormat, Proposal, Vote, VotingStrategy
+from .serialization import column_serializers
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+# every strategy keeps the columns of its former vote table
+EXPORT_FIELDS = {
+    VotingStrategy.SIMPLE: [name for name in Vote.model_fields if name != "weight"],
+    VotingStrategy.TOKEN_WEIGHT: list(Vote.model_fields),
+}
+
+
+async def iter_votes(
+    strategy: VotingStrategy, proposal_id: str
+) -> AsyncIterator[tuple]:
+    """
+    yield the vote rows of a `strategy` proposal as column tuples, none when
+    the proposal has another strategy.
+
+    rows are streamed from the sqlite cursor in batches of `EXPORT_BATCH_SIZE`,
+    so memory stays bounded by the batch size rather than the vote count.
+    the generator owns its session because it outlives the request dependencies.
+    """
+    fields = EXPORT_FIELDS[strategy]
+    columns = [getattr(Vote, name) for name in fields]
+    statement = (
+        select(*columns)
+        .join(Proposal, Proposal.proposal_id == Vote.proposal_id)
+        .where(Vote.proposal_id == proposal_id)
+        .where(Proposal.strategy == strategy)
+        .order_by(Vote.voted_timestamp, Vote.vote_id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    serializers = column_serializers(Vote, fields)
+    async with AsyncSession(read_engine) as session:
+        async for row in await session.stream(statement):
+            yield tuple(serialize(value) for serialize, value in zip(serializers, row))
+
+
+async def iter_ndjson(strategy: VotingStrategy, proposal_id: str) -> AsyncIterator[str]:
+    fields = EXPORT_FIELDS[strategy]
+    lines = []
+    async for row in iter_votes(strategy, proposal_id):
+        lines.append(json.dumps(dict(zip(fields, row))) + "\n")
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+async def iter_csv(strategy: VotingStrategy, proposal_id: str) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(EXPORT_FIELDS[strategy])
+    rows = 0
+    async for row in iter_votes(strategy, proposal_id):
+        writer.writerow(row)
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_votes(
+    strategy: VotingStrategy, proposal_id: str, format: ExportFormat
+) -> StreamingResponse:
+    if format == ExportFormat.CSV:
+        content = iter_csv(strategy, proposal_id)
+    else:
+        content = iter_ndjson(strategy, proposal_id)
+
+    filename = f"{proposal_id}-votes.{format.value}"
+    return StreamingResponse(
+        content,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
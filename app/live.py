@@ -0,0 +1,109 @@
+import asyncio
+import time
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import literal
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import RESULTS_STREAM_KEEPALIVE_SECONDS
+from .cache import next_transition, proposal_key
+from .database import read_engine
+from .events import results_broker
+from .routers.proposals import current_status
+from .schemas import Proposal, Tally, Version
+from .serialization import dumps
+
+
+def sse(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {dumps(data).decode()}\n\n"
+
+
+async def read_results(proposal: Proposal) -> tuple[dict, int]:
+    """
+    the tally of a proposal and the version it was read at.
+
+    both come from one SELECT: reads outside a transaction each see the
+    latest commit, so a vote landing between two reads would be counted in
+    the version but not the tally, and its delta skipped for good.
+    """
+    anchor = select(literal(proposal.proposal_id).label("proposal_id")).subquery()
+    statement = (
+        select(Tally, Version.version)
+        .select_from(anchor)
+        .outerjoin(Tally, Tally.proposal_id == anchor.c.proposal_id)
+        .outerjoin(Version, Version.key == proposal_key(proposal.proposal_id))
+    )
+    async with AsyncSession(read_engine) as session:
+        tally, version = (await session.exec(statement)).one()
+    tally = tally or Tally(proposal_id=proposal.proposal_id)
+    version = version or 0
+    results = {
+        "proposal_id": proposal.proposal_id,
+        "status": current_status(
+            proposal.start_timestamp, proposal.end_timestamp
+        ).value,
+        "yes": tally.yes,
+        "no": tally.no,
+        "yes_weight": tally.yes_weight,
+        "no_weight": tally.no_weight,
+    }
+    return results, version
+
+
+async def stream_results(proposal: Proposal) -> AsyncIterator[str]:
+    """
+    server-sent events of a proposal's results: a `results` snapshot, then
+    a `tally` delta per committed change and a `status` event when the
+    proposal opens or closes.
+
+    deltas carry the proposal version, those already in the snapshot are
+    skipped. the generator owns its session because it outlives the request
+    dependencies.
+    """
+    subscription = results_broker.subscribe(proposal.proposal_id)
+    try:
+        results, version = await read_results(proposal)
+        status = results["status"]
+        yield sse("results", results)
+
+        while True:
+            if subscription.lagged:
+                subscription.resync()
+                results, version = await read_results(proposal)
+                status = results["status"]
+                yield sse("results", results)
+
+            now = time.time()
+            timeout = min(
+                RESULTS_STREAM_KEEPALIVE_SECONDS,
+                next_transition([proposal], now) - now,
+            )
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout)
+            except asyncio.TimeoutError:
+                current = current_status(
+                    proposal.start_timestamp, proposal.end_timestamp
+                ).value
+                if current != status:
+                    status = current
+                    yield sse("status", {"status": status})
+                else:
+                    yield ": keepalive\n\n"
+                continue
+
+            if event["version"] <= version:
+                continue
+            version = event["version"]
+            yield sse("tally", event)
+    finally:
+        results_broker.unsubscribe(subscription)
+
+
+def results_stream(proposal: Proposal) -> StreamingResponse:
+    return StreamingResponse(
+        stream_results(proposal),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
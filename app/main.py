@@ -1,16 +1,57 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
-from .database import create_db_and_tables
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.exc import OperationalError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import (
+    METRICS_ENABLED,
+    PROFILING_ADMIN_TOKEN,
+    STATUS_SWEEP_INTERVAL_SECONDS,
+    VOTE_WRITE_MODE,
+)
+from .database import create_db_and_tables, engine
+from .metrics import CONTENT_TYPE, MetricsMiddleware, metrics
+from .profiling import ProfilingMiddleware
 from .routers import login, votes, proposals
-from contextlib import asynccontextmanager
+from .signature import shutdown_executor
+from .write_queue import vote_write_queue
+
+
+async def sweep_status():
+    async with AsyncSession(engine) as session:
+        return await proposals.sweep_proposal_status(session)
+
+
+async def status_sweeper(interval: float):
+    # persist the status transitions that read endpoints derive lazily
+    while True:
+        with suppress(OperationalError):
+            await sweep_status()
+        await asyncio.sleep(interval)
 
 
 @asynccontextmanager
 async def lifespan(app):
-    create_db_and_tables()
+    await create_db_and_tables()
+    sweeper = asyncio.create_task(status_sweeper(STATUS_SWEEP_INTERVAL_SECONDS))
+    if VOTE_WRITE_MODE == "group":
+        vote_write_queue.start()
     yield
+    await vote_write_queue.stop()
+    sweeper.cancel()
+    with suppress(asyncio.CancelledError):
+        await sweeper
+    shutdown_executor()
 
 
 app = FastAPI(lifespan=lifespan)
+if PROFILING_ADMIN_TOKEN:
+    app.add_middleware(ProfilingMiddleware)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/")
@@ -18,6 +59,11 @@ async def ping():
     return {"message": "OK"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+
 app.include_router(login.router)
 app.include_router(proposals.router)
 app.include_router(votes.router)
@@ -0,0 +1,197 @@
+import math
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+
+from config import METRICS_LATENCY_BUCKETS, METRICS_STATEMENT_BUCKETS
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """
+    cumulative bucket histogram per label values, in prometheus' text format
+    """
+
+    def __init__(
+        self, name: str, help: str, label_names: tuple[str, ...], buckets: tuple
+    ):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # label values -> [counts per bucket and +Inf, sum]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else f"{bound}"
+                extra = f'le="{le}"'
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.label_names, labels, extra)} "
+                    f"{cumulative}"
+                )
+            label_text = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+@dataclass(slots=True)
+class RequestStats:
+    statements: int = 0
+    db_seconds: float = 0.0
+
+
+# SQL statements of the request being served are counted here
+request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None
+)
+# and logged here, with their duration, while it is profiled
+profiled_statements: ContextVar[list[tuple[str, float]] | None] = ContextVar(
+    "profiled_statements", default=None
+)
+
+
+class Metrics:
+    def __init__(self):
+        self.in_flight = 0
+        self.request_duration = Histogram(
+            "http_request_duration_seconds",
+            "Request latency by route template.",
+            ("method", "route", "status"),
+            METRICS_LATENCY_BUCKETS,
+        )
+        self.request_statements = Histogram(
+            "http_request_db_statements",
+            "SQL statements run per request.",
+            ("method", "route"),
+            METRICS_STATEMENT_BUCKETS,
+        )
+        self.request_db_duration = Histogram(
+            "http_request_db_duration_seconds",
+            "Time spent in SQL statements per request.",
+            ("method", "route"),
+            METRICS_LATENCY_BUCKETS,
+        )
+
+    def observe_request(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        stats: RequestStats,
+    ):
+        self.request_duration.observe((method, route, status), seconds)
+        self.request_statements.observe((method, route), stats.statements)
+        self.request_db_duration.observe((method, route), stats.db_seconds)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_in_flight Requests being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+        ]
+        for histogram in (
+            self.request_duration,
+            self.request_statements,
+            self.request_db_duration,
+        ):
+            lines += histogram.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency, status and SQL statements of every
+    request under its route template, e.g. `/proposals/{proposal_id}`
+    """
+
+    def __init__(self, app, registry: Metrics = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        self.registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.registry.in_flight -= 1
+            request_stats.reset(token)
+            # the router stores the matched route in the scope, unmatched
+            # paths share one series to keep the label set bounded
+            route = scope.get("route")
+            self.registry.observe_request(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                status,
+                elapsed,
+                stats,
+            )
+
+
+def instrument_engine(engine):
+    """
+    count the statements run by `engine` and their duration in the stats of
+    the current request
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = time.perf_counter() - context._metrics_start
+        stats = request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+        statements = profiled_statements.get()
+        if statements is not None:
+            statements.append((statement, elapsed))
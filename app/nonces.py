@@ -0,0 +1,103 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from uuid import uuid4
+
+from sqlmodel import delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import NONCE_PURGE_EVERY, NONCE_STORE, NONCE_STORE_SIZE, NONCE_TTL_SECONDS
+from .database import engine
+from .schemas import Nonce
+
+
+class NonceStore(ABC):
+    """
+    issues login nonces and accepts each of them once, within `ttl` seconds
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+    @abstractmethod
+    async def issue(self) -> str: ...
+
+    @abstractmethod
+    async def consume(self, nonce: str) -> bool: ...
+
+
+class MemoryNonceStore(NonceStore):
+    """
+    in-process store. nonces share one ttl, so insertion order is expiry
+    order: expired entries are trimmed from the front and the oldest entry is
+    evicted once `maxsize` is reached, all in O(1).
+    """
+
+    def __init__(self, ttl: float, maxsize: int):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self._nonces: OrderedDict[str, float] = OrderedDict()
+
+    def _trim(self, now: float):
+        while self._nonces:
+            nonce, expires = next(iter(self._nonces.items()))
+            if expires >= now and len(self._nonces) < self.maxsize:
+                break
+            del self._nonces[nonce]
+
+    async def issue(self) -> str:
+        now = time.time()
+        self._trim(now)
+        nonce = uuid4().hex
+        self._nonces[nonce] = now + self.ttl
+        return nonce
+
+    async def consume(self, nonce: str) -> bool:
+        expires = self._nonces.pop(nonce, None)
+        return expires is not None and expires >= time.time()
+
+    def __len__(self):
+        return len(self._nonces)
+
+
+class SQLiteNonceStore(NonceStore):
+    """
+    database backed store shared by every worker. consuming is a single
+    primary key DELETE, expired rows are purged in bulk every
+    `purge_every` issued nonces.
+    """
+
+    def __init__(self, ttl: float, purge_every: int):
+        super().__init__(ttl)
+        self.purge_every = purge_every
+        self._issued = 0
+
+    async def issue(self) -> str:
+        now = time.time()
+        nonce = uuid4().hex
+        async with AsyncSession(engine) as session:
+            session.add(Nonce(nonce=nonce, expires=now + self.ttl))
+            self._issued += 1
+            if self._issued % self.purge_every == 0:
+                await session.exec(delete(Nonce).where(Nonce.expires < now))
+            await session.commit()
+        return nonce
+
+    async def consume(self, nonce: str) -> bool:
+        async with AsyncSession(engine) as session:
+            result = await session.exec(
+                delete(Nonce)
+                .where(Nonce.nonce == nonce)
+                .where(Nonce.expires >= time.time())
+            )
+            await session.commit()
+        return result.rowcount == 1
+
+
+def create_nonce_store() -> NonceStore:
+    if NONCE_STORE == "sqlite":
+        return SQLiteNonceStore(NONCE_TTL_SECONDS, NONCE_PURGE_EVERY)
+    return MemoryNonceStore(NONCE_TTL_SECONDS, NONCE_STORE_SIZE)
+
+
+nonce_store = create_nonce_store()
@@ -0,0 +1,71 @@
+from typing import Annotated
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import and_, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+LimitQuery = Annotated[
+    int,
+    Query(
+        ge=1,
+        le=MAX_PAGE_SIZE,
+        description=f"page size. default: {DEFAULT_PAGE_SIZE}",
+    ),
+]
+CursorQuery = Annotated[
+    str | None,
+    Query(
+        description=f"cursor returned in the `{NEXT_CURSOR_HEADER}` header of the previous page",
+    ),
+]
+
+
+def encode_cursor(timestamp: float, key: str) -> str:
+    return f"{timestamp!r}_{key}"
+
+
+def decode_cursor(cursor: str) -> tuple[float, str]:
+    try:
+        timestamp, key = cursor.rsplit("_", 1)
+        return float(timestamp), key
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid cursor: {cursor}")
+
+
+async def paginate(
+    session: AsyncSession,
+    statement,
+    timestamp_column,
+    key_column,
+    cursor: str | None,
+    limit: int,
+    response: Response,
+) -> list:
+    """
+    fetch one page of `statement` ordered by (timestamp, key).
+
+    the cursor is the last (timestamp, key) seen, so each page is an index
+    range scan no matter how deep it is.
+    """
+    if cursor:
+        timestamp, key = decode_cursor(cursor)
+        statement = statement.where(
+            or_(
+                timestamp_column > timestamp,
+                and_(timestamp_column == timestamp, key_column > key),
+            )
+        )
+    statement = statement.order_by(timestamp_column, key_column).limit(limit + 1)
+
+    rows = list((await session.exec(statement)).all())
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            getattr(last, timestamp_column.key), getattr(last, key_column.key)
+        )
+    return rows
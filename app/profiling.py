@@ -0,0 +1,127 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import time
+from datetime import datetime
+
+from config import PROFILE_DIR, PROFILE_TOP_FUNCTIONS, PROFILING_ADMIN_TOKEN
+from .metrics import profiled_statements
+
+PROFILE_HEADER = b"x-profile"
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware running the requests that carry `X-Profile: <token>`
+    under cProfile. the `<id>.pstats` file and an `<id>.txt` summary (top
+    functions by cumulative time and the SQL statements issued) are written
+    to `directory`, the id is returned in the `X-Profile` response header.
+
+    cProfile sees the whole thread, so other requests served meanwhile show
+    up as well. profiled requests run one at a time.
+    """
+
+    def __init__(
+        self,
+        app,
+        token: str | None = PROFILING_ADMIN_TOKEN,
+        directory: str = PROFILE_DIR,
+    ):
+        self.app = app
+        self.token = token.encode() if token else None
+        self.directory = directory
+        self._lock = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.token is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = next(
+            (value for name, value in scope["headers"] if name == PROFILE_HEADER),
+            None,
+        )
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+        if not hmac.compare_digest(token, self.token):
+            await reject(send)
+            return
+
+        async with self._lock:
+            await self.profile(scope, receive, send)
+
+    async def profile(self, scope, receive, send):
+        profile_id = "{}-{}-{}".format(
+            datetime.now().strftime("%Y%m%dT%H%M%S.%f"),
+            scope["method"],
+            re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root",
+        )
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-profile", profile_id.encode()),
+                ]
+            await send(message)
+
+        statements = []
+        token = profiled_statements.set(statements)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            profiled_statements.reset(token)
+            self.save(profile_id, scope, status, elapsed, profiler, statements)
+
+    def save(self, profile_id, scope, status, elapsed, profiler, statements):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, profile_id)
+        profiler.dump_stats(f"{path}.pstats")
+
+        summary = io.StringIO()
+        query = scope["query_string"].decode()
+        summary.write(
+            f"{scope['method']} {scope['path']}{'?' + query if query else ''} "
+            f"{status} {elapsed * 1000:.1f}ms\n\n"
+        )
+        summary.write(
+            f"{len(statements)} SQL statements, "
+            f"{sum(seconds for _, seconds in statements) * 1000:.1f}ms\n"
+        )
+        for statement, seconds in statements:
+            summary.write(f"{seconds * 1000:8.2f}ms  {json.dumps(statement)}\n")
+        summary.write("\n")
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(
+            PROFILE_TOP_FUNCTIONS
+        )
+        with open(f"{path}.txt", "w") as file:
+            file.write(summary.getvalue())
+
+
+async def reject(send):
+    body = b'{"detail":"Invalid profiling token."}'
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 403,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
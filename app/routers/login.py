@@ -1,15 +1,14 @@
 import jwt
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
-from uuid import uuid4
-from eth_account.messages import encode_defunct
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from web3 import Web3
-from ..auth import JWTBearer
-from config import ALGORITHM, SECRET_KEY, TOKEN_DURATION_MINUTES
-from ..utils import is_eq_address
-from ..dependencies import SessionDep
+from fastapi import APIRouter, HTTPException, Query
+from config import SECRET_KEY, TOKEN_DURATION_MINUTES
+from ..types import Address
+from ..utils import checksum_address, is_eq_address
+from ..dependencies import PrincipalDep, SessionDep
+from ..nonces import nonce_store
 from ..schemas import User
+from ..signature import recover_address_async
 
 router = APIRouter(
     prefix="/auth",
@@ -17,19 +16,19 @@ router = APIRouter(
 )
 
 
-def add_or_update_user(new_user: User, session: SessionDep) -> User:
-    user_db = session.get(User, new_user.wallet_address)
+async def add_or_update_user(new_user: User, session: SessionDep) -> User:
+    user_db = await session.get(User, new_user.wallet_address)
     if user_db is None:
         session.add(new_user)
-        session.commit()
-        session.refresh(new_user)
+        await session.commit()
+        await session.refresh(new_user)
         return new_user
 
     user_data = new_user.model_dump(exclude_unset=True)
     user_db.sqlmodel_update(user_data)
     session.add(user_db)
-    session.commit()
-    session.refresh(user_db)
+    await session.commit()
+    await session.refresh(user_db)
 
     return user_db
 
@@ -40,8 +39,9 @@ def add_or_update_user(new_user: User, session: SessionDep) -> User:
 async def get_nonce():
     """
     Generates a unique nonce for each login request.
+    The nonce can be used to login once, within `NONCE_TTL_SECONDS`.
     """
-    return {"nonce": uuid4().hex}
+    return {"nonce": await nonce_store.issue()}
 
 
 @router.post(
@@ -49,7 +49,7 @@ async def get_nonce():
 )
 async def login(
     wallet_address: Annotated[
-        str,
+        Address,
         Query(
             description="ethereum address of the user",
         ),
@@ -71,12 +71,13 @@ async def login(
     """
     Verify the signature to authenticate the user and associate the wallet with the session.
     """
-    recovered_address = Web3().eth.account.recover_message(
-        encode_defunct(text=str(signed_message)),
-        signature=bytes.fromhex(signature),
-    )
+    # cheap single-use check first, so unknown nonces never cost a recovery
+    if not await nonce_store.consume(str(signed_message)):
+        raise HTTPException(status_code=401, detail="Unknown or expired nonce")
+
+    recovered_address = await recover_address_async(str(signed_message), signature)
 
-    if is_eq_address(wallet_address, recovered_address):
+    if recovered_address and is_eq_address(wallet_address, recovered_address):
         to_encode = {
             "wallet_address": wallet_address,
             "signed_message": signed_message,
@@ -95,7 +96,7 @@ async def login(
             expiration_timestamp=expiration_timestamp,
         )
 
-        add_or_update_user(new_user, session)
+        await add_or_update_user(new_user, session)
         return {"token": encoded_jwt}
     else:
         raise HTTPException(status_code=401, detail="Unauthorized")
@@ -103,19 +104,9 @@ async def login(
 
 @router.post(
     "/whoisme",
-    dependencies=[Depends(JWTBearer())],
 )
-async def who(request: Request):
-    try:
-        token = request.headers["authorization"].split(" ")[1]
-        decoded_token = jwt.decode(
-            token,
-            SECRET_KEY,
-            algorithms=[ALGORITHM],
-        )
-        return {
-            "wallet_address": decoded_token["wallet_address"],
-            "expires": decoded_token["expires"],
-        }
-    except:
-        raise HTTPException(status_code=401, detail="Unauthorized")
+async def who(principal: PrincipalDep):
+    return {
+        "wallet_address": checksum_address(principal.wallet_address),
+        "expires": principal.expires,
+    }
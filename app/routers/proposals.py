@@ -1,12 +1,28 @@
+import math
 from datetime import datetime
 from typing import Annotated, Sequence
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from sqlmodel import select
-
-from ..auth import JWTBearer, get_wallet_from_rq
-from ..dependencies import SessionDep
-from ..schemas import Proposal, ProposalStatus, TokenWeightProposal
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from sqlalchemy import case, func
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import DEFAULT_PAGE_SIZE, FAST_JSON_RESPONSES
+from ..cache import (
+    LISTING_KEYS,
+    bump_versions,
+    cached_json,
+    dump_json,
+    next_transition,
+    proposal_key,
+)
+from ..dependencies import PrincipalDep, ReadSessionDep, SessionDep
+from ..pagination import NEXT_CURSOR_HEADER, CursorQuery, LimitQuery, paginate
+from ..schemas import Proposal, ProposalStatus, VotingStrategy
+from ..search import match_query, search_proposals
+from ..serialization import dumps, model_columns, serialize_rows
+from ..types import Address
 
 router = APIRouter(
     prefix="/proposals",
@@ -14,39 +30,264 @@ router = APIRouter(
 )
 
 
-def update_expired_proposals(session: SessionDep):
-    # fetch all expired proposals
-    current_timestamp = datetime.now().timestamp()
-    proposals_db = session.exec(
-        select(Proposal)
-        .filter(Proposal.status == ProposalStatus.ACTIVE)
-        .filter(current_timestamp > Proposal.end_timestamp)
+def current_status(
+    start_timestamp: float, end_timestamp: float, now: float | None = None
+) -> ProposalStatus:
+    """
+    derive the status of a proposal from its voting window
+    """
+    if now is None:
+        now = datetime.now().timestamp()
+
+    if start_timestamp <= now <= end_timestamp:
+        return ProposalStatus.ACTIVE
+    return ProposalStatus.CLOSED
+
+
+def with_current_status(proposal, now: float | None = None):
+    # refresh the loaded status without marking the row dirty,
+    # so read paths never flush an UPDATE
+    if proposal is not None:
+        status = current_status(proposal.start_timestamp, proposal.end_timestamp, now)
+        set_committed_value(proposal, "status", status)
+    return proposal
+
+
+def in_window(now: float):
+    """
+    sql condition matching the proposals that are active at `now`
+    """
+    return (Proposal.start_timestamp <= now) & (Proposal.end_timestamp >= now)
+
+
+def filter_proposals(
+    statement,
+    strategy: VotingStrategy,
+    status: ProposalStatus | None,
+    proposer: str | None,
+    now: float,
+):
+    statement = statement.where(Proposal.strategy == strategy)
+    if status == ProposalStatus.ACTIVE:
+        statement = statement.where(in_window(now))
+    elif status == ProposalStatus.CLOSED:
+        statement = statement.where(~in_window(now))
+    if proposer:
+        statement = statement.where(Proposal.proposer == proposer)
+    return statement
+
+
+async def sweep_proposal_status(session: AsyncSession) -> int:
+    """
+    persist status transitions of proposals whose window opened or closed
+    """
+    window = in_window(datetime.now().timestamp())
+    closed = await session.exec(
+        update(Proposal)
+        .where(Proposal.status == ProposalStatus.ACTIVE)
+        .where(~window)
+        .values(status=ProposalStatus.CLOSED)
+        .returning(Proposal.proposal_id, Proposal.strategy)
+    )
+    opened = await session.exec(
+        update(Proposal)
+        .where(Proposal.status == ProposalStatus.CLOSED)
+        .where(window)
+        .values(status=ProposalStatus.ACTIVE)
+        .returning(Proposal.proposal_id, Proposal.strategy)
     )
+    changed = [*closed.all(), *opened.all()]
 
-    for proposal in proposals_db:
-        proposal.status = ProposalStatus.CLOSED
+    if changed:
+        listings = {LISTING_KEYS[strategy] for _, strategy in changed}
+        await bump_versions(
+            session,
+            [*listings, *(proposal_key(proposal_id) for proposal_id, _ in changed)],
+        )
+        await session.commit()
+    return len(changed)
 
-    proposals_tw_db = session.exec(
-        select(TokenWeightProposal)
-        .filter(TokenWeightProposal.status == ProposalStatus.ACTIVE)
-        .filter(current_timestamp > TokenWeightProposal.end_timestamp)
+
+async def next_status_change(
+    session: AsyncSession, strategy: VotingStrategy, now: float
+) -> float:
+    """
+    the next time any proposal of `strategy` opens or closes
+    """
+    upcoming = await session.exec(
+        select(
+            func.min(
+                case(
+                    (Proposal.start_timestamp >= now, Proposal.start_timestamp),
+                    else_=Proposal.end_timestamp,
+                )
+            )
+        )
+        .where(Proposal.strategy == strategy)
+        .where(Proposal.end_timestamp >= now)
     )
+    timestamp = upcoming.one()
+    return math.inf if timestamp is None else timestamp
+
+
+async def list_proposals(
+    request: Request,
+    session: AsyncSession,
+    strategy: VotingStrategy,
+    status: ProposalStatus | None,
+    proposer: str | None,
+    cursor: str | None,
+    limit: int,
+) -> Response:
+    now = datetime.now().timestamp()
+
+    async def build():
+        page = Response()
+        # fast path: plain column tuples instead of ORM objects
+        selected = model_columns(Proposal) if FAST_JSON_RESPONSES else [Proposal]
+        statement = filter_proposals(select(*selected), strategy, status, proposer, now)
+        proposals = await paginate(
+            session,
+            statement,
+            Proposal.created_timestamp,
+            Proposal.proposal_id,
+            cursor,
+            limit,
+            page,
+        )
+        if FAST_JSON_RESPONSES:
+            rows = serialize_rows(Proposal, proposals)
+            for row in rows:
+                row["status"] = current_status(
+                    row["start_timestamp"], row["end_timestamp"], now
+                ).value
+            body = dumps(rows)
+        else:
+            proposals = [with_current_status(proposal, now) for proposal in proposals]
+            body = dump_json(list[Proposal], proposals)
+        if status is None:
+            expires = next_transition(proposals, now)
+        else:
+            # any proposal can move in or out of a filtered listing
+            expires = await next_status_change(session, strategy, now)
+        headers = {}
+        if NEXT_CURSOR_HEADER in page.headers:
+            headers[NEXT_CURSOR_HEADER] = page.headers[NEXT_CURSOR_HEADER]
+        return body, headers, expires
+
+    return await cached_json(request, session, [LISTING_KEYS[strategy]], build)
+
+
+SearchQuery = Annotated[
+    str,
+    Query(
+        min_length=1,
+        description="words to look for in titles and descriptions, `word*` matches a prefix",
+    ),
+]
+
+
+async def search(
+    request: Request,
+    session: AsyncSession,
+    strategy: VotingStrategy,
+    q: str,
+    cursor: str | None,
+    limit: int,
+) -> Response:
+    query = match_query(q)
+    if query is None:
+        raise HTTPException(status_code=422, detail=f"Invalid search query: {q}")
+    now = datetime.now().timestamp()
+
+    async def build():
+        page = Response()
+        proposals = await search_proposals(
+            session, strategy, query, cursor, limit, page
+        )
+        proposals = [with_current_status(proposal, now) for proposal in proposals]
+        headers = {}
+        if NEXT_CURSOR_HEADER in page.headers:
+            headers[NEXT_CURSOR_HEADER] = page.headers[NEXT_CURSOR_HEADER]
+        body = dump_json(list[Proposal], proposals)
+        return body, headers, next_transition(proposals, now)
+
+    return await cached_json(request, session, [LISTING_KEYS[strategy]], build)
+
+
+async def get_strategy_proposal(
+    session: AsyncSession, strategy: VotingStrategy, proposal_id: str
+) -> Proposal | None:
+    proposal = await session.get(Proposal, proposal_id)
+    if proposal is None or proposal.strategy != strategy:
+        return None
+    return proposal
+
+
+async def read_proposal(
+    request: Request,
+    session: AsyncSession,
+    strategy: VotingStrategy,
+    proposal_id: str,
+) -> Response:
+    async def build():
+        now = datetime.now().timestamp()
+        proposal = await get_strategy_proposal(session, strategy, proposal_id)
+        proposal = with_current_status(proposal, now)
+        expires = next_transition([proposal] if proposal else [], now)
+        return dump_json(Proposal | None, proposal), {}, expires
+
+    return await cached_json(request, session, [proposal_key(proposal_id)], build)
 
-    for proposals_tw in proposals_tw_db:
-        proposals_tw.status = ProposalStatus.CLOSED
 
-    session.commit()
+async def add_proposal(session: AsyncSession, proposal: Proposal):
+    session.add(proposal)
+    await bump_versions(
+        session, [LISTING_KEYS[proposal.strategy], proposal_key(proposal.proposal_id)]
+    )
+    await session.commit()
+    await session.refresh(proposal)
 
 
 @router.get("/")
-async def get_proposals(session: SessionDep) -> Sequence[Proposal] | None:
+async def get_proposals(
+    request: Request,
+    session: ReadSessionDep,
+    status: Annotated[
+        ProposalStatus | None,
+        Query(
+            description="only list proposals with this status",
+        ),
+    ] = None,
+    proposer: Annotated[
+        Address | None,
+        Query(
+            description="only list proposals created by this address",
+        ),
+    ] = None,
+    cursor: CursorQuery = None,
+    limit: LimitQuery = DEFAULT_PAGE_SIZE,
+) -> Sequence[Proposal] | None:
     """
-    list all proposals
+    list proposals, oldest first, one page at a time
     """
-    update_expired_proposals(session)
+    return await list_proposals(
+        request, session, VotingStrategy.SIMPLE, status, proposer, cursor, limit
+    )
 
-    proposals = session.exec(select(Proposal)).all()
-    return proposals
+
+@router.get("/search")
+async def search_simple_proposals(
+    request: Request,
+    session: ReadSessionDep,
+    q: SearchQuery,
+    cursor: CursorQuery = None,
+    limit: LimitQuery = DEFAULT_PAGE_SIZE,
+) -> Sequence[Proposal]:
+    """
+    search proposals by title and description, best match first
+    """
+    return await search(request, session, VotingStrategy.SIMPLE, q, cursor, limit)
 
 
 @router.get(
@@ -54,24 +295,21 @@ async def get_proposals(session: SessionDep) -> Sequence[Proposal] | None:
 )
 async def get_proposal(
     proposal_id: str,
-    session: SessionDep,
+    request: Request,
+    session: ReadSessionDep,
 ) -> Proposal | None:
     """
     get proposal by proposal id
     """
-    update_expired_proposals(session)
-
-    proposal = session.get(Proposal, proposal_id)
-    return proposal
+    return await read_proposal(request, session, VotingStrategy.SIMPLE, proposal_id)
 
 
 @router.post(
     "/",
-    dependencies=[Depends(JWTBearer())],
 )
 async def create_proposals(
     session: SessionDep,
-    request: Request,
+    principal: PrincipalDep,
     title: Annotated[
         str,
         Query(
@@ -97,14 +335,10 @@ async def create_proposals(
         ),
     ] = 86400.0,
 ) -> Proposal:
-    wallet_address = get_wallet_from_rq(request)
-    if not wallet_address:
-        raise HTTPException(status_code=422, detail="voter address not found.")
-
     proposal = {
         "title": title,
         "description": description,
-        "proposer": wallet_address,
+        "proposer": principal.wallet_address,
         "created_timestamp": datetime.now().timestamp(),
         "start_timestamp": None,
     }
@@ -121,17 +355,13 @@ async def create_proposals(
     else:
         proposal["start_timestamp"] = proposal["created_timestamp"]
 
-    if datetime.now().timestamp() > proposal["start_timestamp"]:
-        proposal["status"] = ProposalStatus.ACTIVE
-    else:
-        proposal["status"] = ProposalStatus.CLOSED
-
     proposal["end_timestamp"] = proposal["start_timestamp"] + duration
+    proposal["status"] = current_status(
+        proposal["start_timestamp"], proposal["end_timestamp"]
+    )
 
     proposal_obj = Proposal(**proposal)
-    session.add(proposal_obj)
-    session.commit()
-    session.refresh(proposal_obj)
+    await add_proposal(session, proposal_obj)
 
     return proposal_obj
 
@@ -143,15 +373,43 @@ async def create_proposals(
 
 @router.get("/token_weight/")
 async def get_token_weight_proposals(
-    session: SessionDep,
-) -> Sequence[TokenWeightProposal] | None:
+    request: Request,
+    session: ReadSessionDep,
+    status: Annotated[
+        ProposalStatus | None,
+        Query(
+            description="only list proposals with this status",
+        ),
+    ] = None,
+    proposer: Annotated[
+        Address | None,
+        Query(
+            description="only list proposals created by this address",
+        ),
+    ] = None,
+    cursor: CursorQuery = None,
+    limit: LimitQuery = DEFAULT_PAGE_SIZE,
+) -> Sequence[Proposal] | None:
     """
-    list all proposals
+    list proposals, oldest first, one page at a time
     """
-    update_expired_proposals(session)
+    return await list_proposals(
+        request, session, VotingStrategy.TOKEN_WEIGHT, status, proposer, cursor, limit
+    )
+
 
-    proposals = session.exec(select(TokenWeightProposal)).all()
-    return proposals
+@router.get("/token_weight/search")
+async def search_token_weight_proposals(
+    request: Request,
+    session: ReadSessionDep,
+    q: SearchQuery,
+    cursor: CursorQuery = None,
+    limit: LimitQuery = DEFAULT_PAGE_SIZE,
+) -> Sequence[Proposal]:
+    """
+    search proposals by title and description, best match first
+    """
+    return await search(request, session, VotingStrategy.TOKEN_WEIGHT, q, cursor, limit)
 
 
 @router.get(
@@ -159,24 +417,23 @@ async def get_token_weight_proposals(
 )
 async def get_token_weight_proposal(
     proposal_id: str,
-    session: SessionDep,
-) -> TokenWeightProposal | None:
+    request: Request,
+    session: ReadSessionDep,
+) -> Proposal | None:
     """
     get proposal by proposal id
     """
-    update_expired_proposals(session)
-
-    proposal = session.get(TokenWeightProposal, proposal_id)
-    return proposal
+    return await read_proposal(
+        request, session, VotingStrategy.TOKEN_WEIGHT, proposal_id
+    )
 
 
 @router.post(
     "/token_weight/",
-    dependencies=[Depends(JWTBearer())],
 )
 async def create_token_weight_proposals(
     session: SessionDep,
-    request: Request,
+    principal: PrincipalDep,
     title: Annotated[
         str,
         Query(
@@ -190,7 +447,7 @@ async def create_token_weight_proposals(
         ),
     ],
     token_address: Annotated[
-        str,
+        Address,
         Query(
             description="address of the token",
         ),
@@ -207,15 +464,12 @@ async def create_token_weight_proposals(
             description="duration of the proposal. default: 86400.0 (1day)",
         ),
     ] = 86400.0,
-) -> TokenWeightProposal:
-    wallet_address = get_wallet_from_rq(request)
-    if not wallet_address:
-        raise HTTPException(status_code=422, detail="voter address not found.")
-
+) -> Proposal:
     proposal = {
         "title": title,
         "description": description,
-        "proposer": wallet_address,
+        "proposer": principal.wallet_address,
+        "strategy": VotingStrategy.TOKEN_WEIGHT,
         "token_address": token_address,
         "created_timestamp": datetime.now().timestamp(),
         "start_timestamp": None,
@@ -233,16 +487,12 @@ async def create_token_weight_proposals(
     else:
         proposal["start_timestamp"] = proposal["created_timestamp"]
 
-    if datetime.now().timestamp() > proposal["start_timestamp"]:
-        proposal["status"] = ProposalStatus.ACTIVE
-    else:
-        proposal["status"] = ProposalStatus.CLOSED
-
     proposal["end_timestamp"] = proposal["start_timestamp"] + duration
+    proposal["status"] = current_status(
+        proposal["start_timestamp"], proposal["end_timestamp"]
+    )
 
-    proposal_obj = TokenWeightProposal(**proposal)
-    session.add(proposal_obj)
-    session.commit()
-    session.refresh(proposal_obj)
+    proposal_obj = Proposal(**proposal)
+    await add_proposal(session, proposal_obj)
 
     return proposal_obj
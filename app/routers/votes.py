@@ -1,50 +1,236 @@
-import random
-from collections import defaultdict
-from fastapi import APIRouter, Request
+import asyncio
+import math
+from fastapi import APIRouter, Request, Response
 from datetime import datetime
 from typing import Annotated
+from uuid import uuid4
 
-from fastapi import Depends, HTTPException, Query
+from fastapi import Body, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
-
-from .proposals import update_expired_proposals
-from ..auth import JWTBearer, get_wallet_from_rq
-from ..dependencies import SessionDep
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import (
+    DEFAULT_PAGE_SIZE,
+    FAST_JSON_RESPONSES,
+    MAX_BULK_RESULTS,
+    MAX_VOTE_BATCH_SIZE,
+    VOTE_WRITE_MODE,
+)
+from .proposals import current_status, get_strategy_proposal
+from ..balances import BalanceUnavailable, balance_provider
+from ..cache import cached_json, dump_json, proposal_key
+from ..dependencies import PrincipalDep, ReadSessionDep, SessionDep
+from ..export import export_votes
+from ..live import results_stream
+from ..pagination import CursorQuery, LimitQuery, paginate
+from ..serialization import model_columns, rows_response
+from ..signature import recover_address_async, vote_message
+from ..snapshots import get_snapshot_balance, get_snapshot_balances
+from ..tally import add_to_tally, get_tallies, get_tally, tally_results
 from ..schemas import (
+    ExportFormat,
     Proposal,
-    TokenWeightProposal,
-    TokenWeightVote,
+    SignedVote,
     Vote,
     Option,
     ProposalStatus,
+    VoteResult,
+    VoteResultStatus,
+    VotingStrategy,
 )
+from ..utils import is_eq_address
+from ..write_queue import vote_write_queue
 
 router = APIRouter(
     tags=["votes"],
 )
 
 
-# Fake function
-# def get_balance(token_address: str, wallet_address: str):
-def fake_get_balance():
-    # Eth balance if wallet_address is zero address
-    # if token_address == constants.ZERO_ADDRESS:
-    #     return get_native_balance(wallet_address)
+async def commit_vote(session: SessionDep, vote: Vote):
+    # (proposal_id, voter_address) is unique, the constraint rejects a second vote
+    # before the tally is touched, both are committed together
+    if VOTE_WRITE_MODE == "group":
+        if not await vote_write_queue.submit(vote):
+            raise HTTPException(status_code=422, detail="You could only vote once.")
+        return
+
+    session.add(vote)
+    try:
+        await add_to_tally(session, vote.proposal_id, [(vote.option, vote.weight)])
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=422, detail="You could only vote once.")
+
+
+async def get_existing_proposal(
+    session: SessionDep, strategy: VotingStrategy, proposal_id: str
+):
+    proposal = await get_strategy_proposal(session, strategy, proposal_id)
+    if not proposal:
+        raise HTTPException(
+            status_code=422,
+            detail=f"proposal: {proposal_id} not found.",
+        )
+    return proposal
+
 
-    # ERC20 balance
-    # erc20 = get_erc20_instance(token_address)
-    # balance_wei = erc20.balance_of(wallet_address)
-    # if balance_wei == 0:
-    #     return 0.0
-    # else:
-    #     return balance_wei / 10 ** (erc20.decimals)
+async def get_open_proposal(
+    session: SessionDep, strategy: VotingStrategy, proposal_id: str
+):
+    proposal = await get_existing_proposal(session, strategy, proposal_id)
 
-    return random.uniform(100, 30_000)
+    status = current_status(proposal.start_timestamp, proposal.end_timestamp)
+    if status == ProposalStatus.CLOSED:
+        raise HTTPException(
+            status_code=422, detail=f"proposal: {proposal_id} is closed"
+        )
+    return proposal
+
+
+async def list_votes(
+    session: AsyncSession,
+    strategy: VotingStrategy,
+    proposal_id: str,
+    cursor: str | None,
+    limit: int,
+    response: Response,
+):
+    """
+    one page of the votes of a `strategy` proposal, none when the proposal
+    has another strategy
+    """
+    # fast path: plain column tuples instead of ORM objects
+    selected = model_columns(Vote) if FAST_JSON_RESPONSES else [Vote]
+    statement = (
+        select(*selected)
+        .join(Proposal, Proposal.proposal_id == Vote.proposal_id)
+        .where(Vote.proposal_id == proposal_id)
+        .where(Proposal.strategy == strategy)
+    )
+    votes = await paginate(
+        session,
+        statement,
+        Vote.voted_timestamp,
+        Vote.vote_id,
+        cursor,
+        limit,
+        response,
+    )
+    if FAST_JSON_RESPONSES:
+        return rows_response(Vote, votes, response)
+
+    return votes
+
+
+async def commit_votes_batch(
+    session: SessionDep,
+    proposal_id: str,
+    signed_votes: list[SignedVote],
+    voting_power,
+) -> list[VoteResult]:
+    """
+    verify pre-signed votes and insert the valid ones with one bulk INSERT,
+    one tally update and one commit.
+
+    `voting_power` maps the voters with a valid signature to their weight.
+    """
+    recovered = await asyncio.gather(
+        *(
+            recover_address_async(
+                vote_message(proposal_id, vote.option.value), vote.signature
+            )
+            for vote in signed_votes
+        )
+    )
+
+    results: list[VoteResult | None] = [None] * len(signed_votes)
+    candidates: dict[str, int] = {}
+    for i, (vote, address) in enumerate(zip(signed_votes, recovered)):
+        if address is None or not is_eq_address(address, vote.voter_address):
+            detail = "Invalid signature."
+        elif vote.voter_address in candidates:
+            detail = "Duplicate vote in batch."
+        else:
+            candidates[vote.voter_address] = i
+            continue
+        results[i] = VoteResult(
+            voter_address=vote.voter_address,
+            status=VoteResultStatus.REJECTED,
+            detail=detail,
+        )
+
+    weights = await voting_power(list(candidates))
+    voted_timestamp = int(datetime.now().timestamp())
+    rows = []
+    for voter_address, i in candidates.items():
+        if weights[voter_address] == 0:
+            results[i] = VoteResult(
+                voter_address=voter_address,
+                status=VoteResultStatus.REJECTED,
+                detail="Zero voting power",
+            )
+            continue
+        row = {
+            "vote_id": uuid4().hex,
+            "proposal_id": proposal_id,
+            "voter_address": voter_address,
+            "voted_timestamp": voted_timestamp,
+            "option": signed_votes[i].option,
+            "weight": weights[voter_address],
+        }
+        rows.append(row)
+
+    inserted = set()
+    if rows:
+        # voters who already voted hit the unique index and are skipped
+        inserted = set(
+            (
+                await session.exec(
+                    sqlite_insert(Vote)
+                    .on_conflict_do_nothing()
+                    .returning(Vote.voter_address),
+                    params=rows,
+                )
+            )
+            .scalars()
+            .all()
+        )
+        await add_to_tally(
+            session,
+            proposal_id,
+            [
+                (row["option"], row["weight"])
+                for row in rows
+                if row["voter_address"] in inserted
+            ],
+        )
+        await session.commit()
+
+    for row in rows:
+        voter_address = row["voter_address"]
+        if voter_address in inserted:
+            result = VoteResult(
+                voter_address=voter_address,
+                status=VoteResultStatus.ACCEPTED,
+                vote_id=row["vote_id"],
+            )
+        else:
+            result = VoteResult(
+                voter_address=voter_address,
+                status=VoteResultStatus.REJECTED,
+                detail="You could only vote once.",
+            )
+        results[candidates[voter_address]] = result
+
+    return results
 
 
 @router.post(
     "/proposals/{proposal_id}/vote",
-    dependencies=[Depends(JWTBearer())],
 )
 async def cast_vote(
     proposal_id: str,
@@ -55,36 +241,13 @@ async def cast_vote(
         ),
     ],
     session: SessionDep,
-    request: Request,
+    principal: PrincipalDep,
 ) -> Vote | None:
     """
     vote a proposal by a proposal id
     """
-    update_expired_proposals(session)
-
-    proposal = session.get(Proposal, proposal_id)
-    if not proposal:
-        raise HTTPException(
-            status_code=422,
-            detail=f"proposal: {proposal_id} not found.",
-        )
-
-    if proposal.status == ProposalStatus.CLOSED:
-        raise HTTPException(
-            status_code=422, detail=f"proposal: {proposal_id} is closed"
-        )
-    voter_address = get_wallet_from_rq(request)
-    if voter_address is None:
-        raise HTTPException(status_code=422, detail="voter address not found.")
-
-    # check valid vote
-    prev_vote = session.exec(
-        select(Vote)
-        .filter(Vote.voter_address == voter_address)
-        .filter(Vote.proposal_id == proposal_id)
-    ).all()
-    if prev_vote:
-        raise HTTPException(status_code=422, detail="You could only vote once.")
+    await get_open_proposal(session, VotingStrategy.SIMPLE, proposal_id)
+    voter_address = principal.wallet_address
 
     vote = {
         "proposal_id": proposal_id,
@@ -93,58 +256,121 @@ async def cast_vote(
         "voted_timestamp": int(datetime.now().timestamp()),
     }
     vote_obj = Vote(**vote)
-    session.add(vote_obj)
-    session.commit()
-    session.refresh(vote_obj)
+    await commit_vote(session, vote_obj)
     return vote_obj
 
 
+@router.post("/proposals/{proposal_id}/votes/batch")
+async def cast_votes_batch(
+    proposal_id: str,
+    votes: Annotated[
+        list[SignedVote],
+        Body(
+            max_length=MAX_VOTE_BATCH_SIZE,
+            description="votes signed by each voter, see `vote_message`",
+        ),
+    ],
+    session: SessionDep,
+) -> list[VoteResult]:
+    """
+    submit many pre-signed votes of a proposal at once
+    """
+    await get_open_proposal(session, VotingStrategy.SIMPLE, proposal_id)
+
+    async def voting_power(voters: list[str]) -> dict[str, float]:
+        return dict.fromkeys(voters, 1.0)
+
+    return await commit_votes_batch(session, proposal_id, votes, voting_power)
+
+
 @router.get("/proposals/{proposal_id}/votes")
 async def get_votes(
     proposal_id: str,
-    session: SessionDep,
+    session: ReadSessionDep,
+    response: Response,
+    cursor: CursorQuery = None,
+    limit: LimitQuery = DEFAULT_PAGE_SIZE,
 ) -> list[Vote] | None:
     """
-    get all votes of a proposal
+    get the votes of a proposal, oldest first, one page at a time
     """
-    update_expired_proposals(session)
+    return await list_votes(
+        session, VotingStrategy.SIMPLE, proposal_id, cursor, limit, response
+    )
 
-    votes = session.exec(select(Vote).filter(Vote.proposal_id == proposal_id)).all()
 
-    return votes
+@router.get("/proposals/{proposal_id}/votes/export")
+async def export_proposal_votes(
+    proposal_id: str,
+    format: Annotated[
+        ExportFormat,
+        Query(
+            description="`ndjson` or `csv`",
+        ),
+    ] = ExportFormat.NDJSON,
+) -> StreamingResponse:
+    """
+    stream all votes of a proposal
+    """
+    return export_votes(VotingStrategy.SIMPLE, proposal_id, format)
 
 
 @router.get("/proposals/{proposal_id}/results")
 async def get_results(
     proposal_id: str,
-    session: SessionDep,
+    request: Request,
+    session: ReadSessionDep,
 ) -> dict | None:
     """
     get all votes of a proposal
     """
-    update_expired_proposals(session)
 
-    votes = session.exec(select(Vote).filter(Vote.proposal_id == proposal_id)).all()
-    result = defaultdict(int)
+    async def build():
+        tally = await get_tally(session, proposal_id, VotingStrategy.SIMPLE)
+        results = tally_results(VotingStrategy.SIMPLE, tally)
+        return dump_json(dict, results), {}, math.inf
 
-    for vote in votes:
-        result[vote.option] += 1
+    return await cached_json(request, session, [proposal_key(proposal_id)], build)
 
-    winner = "invalid"
-    if result[Option.YES] > result[Option.NO]:
-        winner = "yes"
-    elif result[Option.NO] > result[Option.YES]:
-        winner = "no"
-    elif result[Option.Yes] == result[Option.NO] and result[Option.YES] > 0:
-        winner = "draw"
 
-    return {
-        "proposal_id": proposal_id,
-        "# of votes": result[Option.YES] + result[Option.NO],
-        "yes": result[Option.YES],
-        "no": result[Option.NO],
-        "winner": winner,
-    }
+@router.get("/results")
+async def get_bulk_results(
+    request: Request,
+    session: ReadSessionDep,
+    proposal_id: Annotated[
+        list[str],
+        Query(
+            min_length=1,
+            max_length=MAX_BULK_RESULTS,
+            description="ids of the proposals, plain or token weight",
+        ),
+    ],
+) -> list[dict]:
+    """
+    get the results of many proposals at once, in the order asked.
+    unknown proposals are left out
+    """
+    proposal_ids = list(dict.fromkeys(proposal_id))
+
+    async def build():
+        tallies = await get_tallies(session, proposal_ids)
+        results = [tally_results(strategy, tally) for strategy, tally in tallies]
+        return dump_json(list[dict], results), {}, math.inf
+
+    keys = [proposal_key(proposal_id) for proposal_id in proposal_ids]
+    return await cached_json(request, session, keys, build)
+
+
+@router.get("/proposals/{proposal_id}/results/stream")
+async def stream_proposal_results(
+    proposal_id: str,
+    session: ReadSessionDep,
+) -> StreamingResponse:
+    """
+    follow the results of a proposal as server-sent events
+    """
+    proposal = await get_existing_proposal(session, VotingStrategy.SIMPLE, proposal_id)
+    return results_stream(proposal)
 
 
 """
@@ -154,7 +380,6 @@ async def get_results(
 
 @router.post(
     "/proposals/token_weight/{proposal_id}/vote",
-    dependencies=[Depends(JWTBearer())],
 )
 async def cast_vote_token_weight(
     proposal_id: str,
@@ -165,41 +390,31 @@ async def cast_vote_token_weight(
         ),
     ],
     session: SessionDep,
-    request: Request,
-) -> TokenWeightVote | None:
+    principal: PrincipalDep,
+) -> Vote | None:
     """
     vote a proposal by a proposal id
     """
-    update_expired_proposals(session)
-
-    proposal = session.get(TokenWeightProposal, proposal_id)
-    if not proposal:
-        raise HTTPException(
-            status_code=422,
-            detail=f"proposal: {proposal_id} not found.",
-        )
-
-    if proposal.status == ProposalStatus.CLOSED:
-        raise HTTPException(
-            status_code=422, detail=f"proposal: {proposal_id} is closed"
-        )
-    voter_address = get_wallet_from_rq(request)
-    if voter_address is None:
-        raise HTTPException(status_code=422, detail="voter address not found.")
-
-    token_balance = fake_get_balance()
+    proposal = await get_open_proposal(
+        session, VotingStrategy.TOKEN_WEIGHT, proposal_id
+    )
+    voter_address = principal.wallet_address
+
+    # voting power comes from the snapshot when the proposal has one,
+    # otherwise from the live token balance
+    token_balance = await get_snapshot_balance(session, proposal, voter_address)
+    if token_balance is None:
+        try:
+            token_balance = await balance_provider.get_balance(
+                proposal.token_address, voter_address
+            )
+        except BalanceUnavailable as exc:
+            raise HTTPException(
+                status_code=503, detail=f"token balance unavailable: {exc}"
+            )
     if token_balance == 0:
         raise HTTPException(status_code=422, detail="Zero voting power")
 
-    # check valid vote
-    prev_vote = session.exec(
-        select(TokenWeightVote)
-        .filter(TokenWeightVote.voter_address == voter_address)
-        .filter(TokenWeightVote.proposal_id == proposal_id)
-    ).all()
-    if prev_vote:
-        raise HTTPException(status_code=422, detail="You could only vote once.")
-
     vote = {
         "proposal_id": proposal_id,
         "voter_address": voter_address,
@@ -207,60 +422,103 @@ async def cast_vote_token_weight(
         "voted_timestamp": int(datetime.now().timestamp()),
         "weight": token_balance,
     }
-    vote_obj = TokenWeightVote(**vote)
-    session.add(vote_obj)
-    session.commit()
-    session.refresh(vote_obj)
+    vote_obj = Vote(**vote)
+    await commit_vote(session, vote_obj)
     return vote_obj
 
 
+@router.post("/proposals/token_weight/{proposal_id}/votes/batch")
+async def cast_votes_batch_token_weight(
+    proposal_id: str,
+    votes: Annotated[
+        list[SignedVote],
+        Body(
+            max_length=MAX_VOTE_BATCH_SIZE,
+            description="votes signed by each voter, see `vote_message`",
+        ),
+    ],
+    session: SessionDep,
+) -> list[VoteResult]:
+    """
+    submit many pre-signed votes of a token weight proposal at once
+    """
+    proposal = await get_open_proposal(
+        session, VotingStrategy.TOKEN_WEIGHT, proposal_id
+    )
+
+    async def voting_power(voters: list[str]) -> dict[str, float]:
+        balances = await get_snapshot_balances(session, proposal, voters)
+        if balances is not None:
+            return balances
+        try:
+            return await balance_provider.get_balances(proposal.token_address, voters)
+        except BalanceUnavailable as exc:
+            raise HTTPException(
+                status_code=503, detail=f"token balance unavailable: {exc}"
+            )
+
+    return await commit_votes_batch(session, proposal_id, votes, voting_power)
+
+
 @router.get("/proposals/token_weight/{proposal_id}/votes")
 async def get_token_weight_votes(
     proposal_id: str,
-    session: SessionDep,
-) -> list[TokenWeightVote] | None:
+    session: ReadSessionDep,
+    response: Response,
+    cursor: CursorQuery = None,
+    limit: LimitQuery = DEFAULT_PAGE_SIZE,
+) -> list[Vote] | None:
     """
-    get all votes of a token weight proposal
+    get the votes of a token weight proposal, oldest first, one page at a time
     """
-    update_expired_proposals(session)
+    return await list_votes(
+        session, VotingStrategy.TOKEN_WEIGHT, proposal_id, cursor, limit, response
+    )
 
-    votes = session.exec(
-        select(TokenWeightVote).filter(TokenWeightVote.proposal_id == proposal_id)
-    ).all()
 
-    return votes
+@router.get("/proposals/token_weight/{proposal_id}/votes/export")
+async def export_token_weight_votes(
+    proposal_id: str,
+    format: Annotated[
+        ExportFormat,
+        Query(
+            description="`ndjson` or `csv`",
+        ),
+    ] = ExportFormat.NDJSON,
+) -> StreamingResponse:
+    """
+    stream all votes of a token weight proposal
+    """
+    return export_votes(VotingStrategy.TOKEN_WEIGHT, proposal_id, format)
 
 
 @router.get("/proposals/token_weight/{proposal_id}/results")
 async def get_token_weight_results(
     proposal_id: str,
-    session: SessionDep,
+    request: Request,
+    session: ReadSessionDep,
 ) -> dict | None:
     """
     get all votes of a token weight proposal
     """
-    update_expired_proposals(session)
 
-    votes = session.exec(
-        select(TokenWeightVote).filter(TokenWeightVote.proposal_id == proposal_id)
-    ).all()
-    result = defaultdict(int)
+    async def build():
+        tally = await get_tally(session, proposal_id, VotingStrategy.TOKEN_WEIGHT)
+        results = tally_results(VotingStrategy.TOKEN_WEIGHT, tally)
+        return dump_json(dict, results), {}, math.inf
 
-    for vote in votes:
-        result[vote.option] += vote.weight
+    return await cached_json(request, session, [proposal_key(proposal_id)], build)
 
-    winner = "invalid"
-    if result[Option.YES] > result[Option.NO]:
-        winner = "yes"
-    elif result[Option.NO] > result[Option.YES]:
-        winner = "no"
-    elif result[Option.Yes] == result[Option.NO] and result[Option.YES] > 0:
-        winner = "draw"
 
-    return {
-        "proposal_id": proposal_id,
-        "total_voting_power": result[Option.YES] + result[Option.NO],
-        "yes": result[Option.YES],
-        "no": result[Option.NO],
-        "winner": winner,
-    }
+@router.get("/proposals/token_weight/{proposal_id}/results/stream")
+async def stream_token_weight_results(
+    proposal_id: str,
+    session: ReadSessionDep,
+) -> StreamingResponse:
+    """
+    follow the results of a token weight proposal as server-sent events
+    """
+    proposal = await get_existing_proposal(
+        session, VotingStrategy.TOKEN_WEIGHT, proposal_id
+    )
+    return results_stream(proposal)
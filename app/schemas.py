@@ -1,7 +1,9 @@
-from sqlmodel import Field, SQLModel
+from sqlmodel import Field, Index, SQLModel
 from enum import Enum
 from uuid import uuid4
 
+from .types import Address
+
 
 class Option(str, Enum):
     YES = "yes"
@@ -13,50 +15,119 @@ class ProposalStatus(str, Enum):
     CLOSED = "closed"
 
 
+class VotingStrategy(str, Enum):
+    # one address, one vote
+    SIMPLE = "simple"
+    # votes weighed by the voter's balance of `token_address`
+    TOKEN_WEIGHT = "token_weight"
+
+
+class VoteResultStatus(str, Enum):
+    ACCEPTED = "accepted"
+    REJECTED = "rejected"
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
 class User(SQLModel, table=True):
-    wallet_address: str = Field(primary_key=True)
+    wallet_address: Address = Field(primary_key=True)
     token: str | None
     expiration_timestamp: float | None
 
 
+class Nonce(SQLModel, table=True):
+    nonce: str = Field(primary_key=True)
+    expires: float = Field(index=True)
+
+
 class Proposal(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_proposal_status_end", "status", "end_timestamp"),
+        Index(
+            "ix_proposal_strategy_created",
+            "strategy",
+            "created_timestamp",
+            "proposal_id",
+        ),
+        Index(
+            "ix_proposal_strategy_proposer_created",
+            "strategy",
+            "proposer",
+            "created_timestamp",
+            "proposal_id",
+        ),
+    )
+
     proposal_id: str = Field(default_factory=lambda: uuid4().hex, primary_key=True)
     title: str
     description: str
-    proposer: str
+    proposer: Address
     created_timestamp: float
     start_timestamp: float
     end_timestamp: float
     status: ProposalStatus
 
+    strategy: VotingStrategy = VotingStrategy.SIMPLE
+    # token weighing the votes, `VotingStrategy.TOKEN_WEIGHT` only
+    token_address: Address | None = None
+
 
 class Vote(SQLModel, table=True):
+    __table_args__ = (
+        Index("ux_vote_proposal_voter", "proposal_id", "voter_address", unique=True),
+        Index("ix_vote_proposal_voted", "proposal_id", "voted_timestamp", "vote_id"),
+    )
+
     vote_id: str = Field(default_factory=lambda: uuid4().hex, primary_key=True)
     proposal_id: str
-    voter_address: str
+    voter_address: Address
     voted_timestamp: int
     option: Option
 
+    # voting power, 1.0 for one address one vote
+    weight: float = 1.0
 
-# @TODO: Inherite from Proposal
-class TokenWeightProposal(SQLModel, table=True):
-    proposal_id: str = Field(default_factory=lambda: uuid4().hex, primary_key=True)
-    title: str
-    description: str
-    proposer: str
+
+class Tally(SQLModel, table=True):
+    proposal_id: str = Field(primary_key=True)
+    yes: int = 0
+    no: int = 0
+    yes_weight: float = 0.0
+    no_weight: float = 0.0
+
+
+class Snapshot(SQLModel, table=True):
+    # a proposal id, or a token address shared by its proposals
+    snapshot_id: str = Field(primary_key=True)
     created_timestamp: float
-    start_timestamp: float
-    end_timestamp: float
-    status: ProposalStatus
+    wallets: int
 
-    token_address: str
 
+class SnapshotBalance(SQLModel, table=True):
+    snapshot_id: str = Field(primary_key=True)
+    wallet_address: Address = Field(primary_key=True)
+    balance: float
 
-class TokenWeightVote(SQLModel, table=True):
-    vote_id: str = Field(default_factory=lambda: uuid4().hex, primary_key=True)
-    proposal_id: str
-    voter_address: str
-    voted_timestamp: int
+
+class SignedVote(SQLModel):
+    voter_address: Address
     option: Option
+    # signature of `vote_message(proposal_id, option)` by the voter
+    signature: str
+
+
+class VoteResult(SQLModel):
+    voter_address: Address
+    status: VoteResultStatus
+    vote_id: str | None = None
+    detail: str | None = None
+
 
-    weight: float
+class Version(SQLModel, table=True):
+    # "proposals", "token_weight_proposals" or "proposal:<proposal_id>",
+    # "schema" holds the fingerprint of the schema the database was set up with
+    key: str = Field(primary_key=True)
+    version: int = 0
@@ -0,0 +1,104 @@
+import re
+
+from fastapi import HTTPException, Response
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    and_,
+    func,
+    literal_column,
+    or_,
+)
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from .schemas import Proposal, VotingStrategy
+
+# created by the v3 migration, kept out of SQLModel.metadata so `create_all`
+# never tries to create it as a plain table
+proposal_fts = Table(
+    "proposal_fts",
+    MetaData(),
+    Column("rowid", Integer, primary_key=True),
+    Column("proposal_id", String),
+    Column("strategy", String),
+    Column("title", String),
+    Column("description", String),
+)
+
+TERM_PATTERN = re.compile(r"\w+\*?")
+
+# bm25 weights of the proposal_id, strategy, title and description columns
+RANK_WEIGHTS = (0.0, 0.0, 10.0, 1.0)
+
+
+def match_query(query: str) -> str | None:
+    """
+    FTS5 query matching every word of `query`, a word ending with `*` is a
+    prefix. anything else is dropped, so user input can't inject FTS5 syntax.
+    """
+    terms = []
+    for term in TERM_PATTERN.findall(query):
+        word = term.rstrip("*")
+        terms.append(f'"{word}"*' if term.endswith("*") else f'"{word}"')
+    return " ".join(terms) or None
+
+
+async def search_proposals(
+    session: AsyncSession,
+    strategy: VotingStrategy,
+    query: str,
+    cursor: str | None,
+    limit: int,
+    response: Response,
+) -> list[Proposal]:
+    """
+    one page of the proposals of `strategy` matching `query`, best match
+    first. titles weigh more than descriptions.
+
+    matches are ranked and paged on the FTS rowid alone, the proposals are
+    only loaded for the page.
+    """
+    table = literal_column(proposal_fts.name)
+    match = f'strategy : "{strategy.name}" AND {{title description}} : ({query})'
+    ranked = (
+        select(proposal_fts.c.rowid, func.bm25(table, *RANK_WEIGHTS).label("rank"))
+        .where(table.op("MATCH")(match))
+        .subquery()
+    )
+    statement = select(ranked.c.rowid, ranked.c.rank)
+    # bm25 is lower for better matches, ties are broken by rowid
+    if cursor:
+        rank, key = decode_cursor(cursor)
+        if not key.isdigit():
+            raise HTTPException(status_code=422, detail=f"Invalid cursor: {cursor}")
+        statement = statement.where(
+            or_(
+                ranked.c.rank > rank,
+                and_(ranked.c.rank == rank, ranked.c.rowid > int(key)),
+            )
+        )
+    statement = statement.order_by(ranked.c.rank, ranked.c.rowid).limit(limit + 1)
+
+    page = list((await session.exec(statement)).all())
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            page[-1].rank, page[-1].rowid
+        )
+
+    rowids = [row.rowid for row in page]
+    proposals = dict(
+        (
+            await session.exec(
+                select(proposal_fts.c.rowid, Proposal)
+                .join(Proposal, Proposal.proposal_id == proposal_fts.c.proposal_id)
+                .where(proposal_fts.c.rowid.in_(rowids))
+            )
+        ).all()
+    )
+    return [proposals[rowid] for rowid in rowids]
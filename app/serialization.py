@@ -0,0 +1,90 @@
+import json
+from enum import Enum
+from typing import Annotated, Iterable, get_args, get_origin
+
+from fastapi import Response
+from pydantic import PlainSerializer
+
+try:
+    import orjson
+except ImportError:  # optional, the standard encoder is used instead
+    orjson = None
+
+from .pagination import NEXT_CURSOR_HEADER
+
+
+def _plain(value):
+    return value.value if isinstance(value, Enum) else value
+
+
+def _plain_serializer(metadata: Iterable, annotation):
+    """
+    the PlainSerializer function of a field, from its metadata or nested in
+    its annotation, e.g. `Address | None` keeps it inside the Optional
+    """
+    for item in metadata:
+        if isinstance(item, PlainSerializer):
+            return item.func
+    if get_origin(annotation) is Annotated:
+        return _plain_serializer(annotation.__metadata__, get_args(annotation)[0])
+    for arg in get_args(annotation):
+        serializer = _plain_serializer((), arg)
+        if serializer is not None:
+            return serializer
+    return None
+
+
+def _skip_none(serializer):
+    return lambda value: None if value is None else serializer(value)
+
+
+def column_serializers(model, fields: list[str]) -> list:
+    # apply the fields' own serializers (e.g. checksum addresses) to the raw columns
+    serializers = []
+    for field in map(model.model_fields.get, fields):
+        serializer = _plain_serializer(field.metadata, field.annotation)
+        serializers.append(_plain if serializer is None else _skip_none(serializer))
+    return serializers
+
+
+def model_columns(model) -> list:
+    """
+    the columns of `model` in field order, to select rows as plain tuples
+    """
+    return [getattr(model, name) for name in model.model_fields]
+
+
+def serialize_rows(model, rows: Iterable[tuple]) -> list[dict]:
+    """
+    rows selected with `model_columns` as the dicts `model` would dump to,
+    without building or validating a model per row
+    """
+    fields = list(model.model_fields)
+    serializers = column_serializers(model, fields)
+    return [
+        {
+            name: serialize(value)
+            for name, serialize, value in zip(fields, serializers, row)
+        }
+        for row in rows
+    ]
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def rows_response(model, rows: Iterable[tuple], page: Response) -> Response:
+    """
+    JSON response of `rows`, carrying the cursor `paginate` set on `page`
+    """
+    headers = {}
+    if NEXT_CURSOR_HEADER in page.headers:
+        headers[NEXT_CURSOR_HEADER] = page.headers[NEXT_CURSOR_HEADER]
+    return Response(
+        content=dumps(serialize_rows(model, rows)),
+        media_type="application/json",
+        headers=headers,
+    )
@@ -0,0 +1,98 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from eth_hash.auto import keccak
+
+from config import SIGNATURE_BACKEND, SIGNATURE_EXECUTOR, SIGNATURE_WORKERS
+
+_keys = None
+_executor: Executor | None = None
+
+
+def get_keys():
+    """
+    the verifier of this process, reused by every login. eth_keys is only
+    imported on first use, it is the slowest import of the app.
+    """
+    global _keys
+    if _keys is None:
+        from eth_keys import KeyAPI
+        from eth_keys.backends import get_backend
+
+        _keys = KeyAPI(get_backend(SIGNATURE_BACKEND))
+    return _keys
+
+
+def personal_message_hash(message: str) -> bytes:
+    """
+    EIP-191 hash of a personal_sign message
+    """
+    data = message.encode()
+    return keccak(b"\x19Ethereum Signed Message:\n" + str(len(data)).encode() + data)
+
+
+def vote_message(proposal_id: str, option: str) -> str:
+    """
+    message a voter signs to submit a vote through a relayer
+    """
+    return f"vote:{proposal_id}:{option}"
+
+
+def recover_address(message: str, signature: str) -> str | None:
+    """
+    recover the checksum address that signed `message` (EIP-191 personal_sign).
+
+    returns None if the signature is malformed.
+    """
+    from eth_keys.exceptions import BadSignature, ValidationError
+
+    try:
+        signature_bytes = bytes.fromhex(signature.removeprefix("0x"))
+        if len(signature_bytes) != 65:
+            return None
+        v = signature_bytes[64]
+        if v >= 27:
+            v -= 27
+        vrs = (
+            v,
+            int.from_bytes(signature_bytes[0:32], "big"),
+            int.from_bytes(signature_bytes[32:64], "big"),
+        )
+        public_key = (
+            get_keys()
+            .Signature(vrs=vrs)
+            .recover_public_key_from_msg_hash(personal_message_hash(message))
+        )
+    except (ValueError, BadSignature, ValidationError):
+        return None
+
+    return public_key.to_checksum_address()
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if SIGNATURE_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=SIGNATURE_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=SIGNATURE_WORKERS, thread_name_prefix="signature"
+            )
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def recover_address_async(message: str, signature: str) -> str | None:
+    """
+    `recover_address` on the signature pool, keeping the event loop free
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), recover_address, message, signature
+    )
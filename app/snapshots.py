@@ -0,0 +1,187 @@
+import argparse
+import asyncio
+import csv
+import sys
+from datetime import datetime
+from typing import Iterator
+
+from sqlalchemy import and_, case, delete, insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import SNAPSHOT_BATCH_SIZE
+from .schemas import Proposal, Snapshot, SnapshotBalance
+from .utils import normalize_address
+
+
+async def get_snapshot_balance(
+    session: AsyncSession, proposal: Proposal, wallet_address: str
+) -> float | None:
+    """
+    voting power of a wallet from the snapshot of the proposal, falling back to
+    the snapshot of its token. a wallet missing from the snapshot has none.
+
+    returns None when neither snapshot exists.
+    """
+    row = (
+        await session.exec(
+            select(Snapshot.snapshot_id, SnapshotBalance.balance)
+            .outerjoin(
+                SnapshotBalance,
+                and_(
+                    SnapshotBalance.snapshot_id == Snapshot.snapshot_id,
+                    SnapshotBalance.wallet_address == wallet_address,
+                ),
+            )
+            .where(
+                Snapshot.snapshot_id.in_([proposal.proposal_id, proposal.token_address])
+            )
+            .order_by(case((Snapshot.snapshot_id == proposal.proposal_id, 0), else_=1))
+            .limit(1)
+        )
+    ).first()
+    if row is None:
+        return None
+    return row.balance or 0.0
+
+
+async def get_snapshot_balances(
+    session: AsyncSession, proposal: Proposal, wallet_addresses: list[str]
+) -> dict[str, float] | None:
+    """
+    `get_snapshot_balance` for many wallets, in two queries
+    """
+    snapshot_ids = (
+        await session.exec(
+            select(Snapshot.snapshot_id).where(
+                Snapshot.snapshot_id.in_([proposal.proposal_id, proposal.token_address])
+            )
+        )
+    ).all()
+    if not snapshot_ids:
+        return None
+    snapshot_id = (
+        proposal.proposal_id
+        if proposal.proposal_id in snapshot_ids
+        else proposal.token_address
+    )
+
+    balances = dict.fromkeys(wallet_addresses, 0.0)
+    rows = await session.exec(
+        select(SnapshotBalance.wallet_address, SnapshotBalance.balance)
+        .where(SnapshotBalance.snapshot_id == snapshot_id)
+        .where(SnapshotBalance.wallet_address.in_(wallet_addresses))
+    )
+    balances.update(rows.all())
+    return balances
+
+
+def read_csv(path: str) -> Iterator[tuple[str, float]]:
+    with open(path, newline="") as file:
+        for line, row in enumerate(csv.DictReader(file), start=2):
+            try:
+                yield normalize_address(row["wallet_address"]), float(row["balance"])
+            except (KeyError, TypeError, ValueError) as exc:
+                raise ValueError(f"{path}:{line}: {exc}")
+
+
+def read_parquet(path: str) -> Iterator[tuple[str, float]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("importing parquet snapshots requires `pyarrow`")
+
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(
+        batch_size=SNAPSHOT_BATCH_SIZE, columns=["wallet_address", "balance"]
+    ):
+        columns = batch.to_pydict()
+        for wallet, balance in zip(columns["wallet_address"], columns["balance"]):
+            yield normalize_address(wallet), float(balance)
+
+
+def read_snapshot(path: str) -> Iterator[tuple[str, float]]:
+    if path.endswith(".parquet"):
+        return read_parquet(path)
+    return read_csv(path)
+
+
+async def import_snapshot(
+    session: AsyncSession,
+    snapshot_id: str,
+    balances: Iterator[tuple[str, float]],
+    batch_size: int = SNAPSHOT_BATCH_SIZE,
+) -> int:
+    """
+    replace the snapshot `snapshot_id` with `balances`, inserted in batches of
+    `batch_size` rows within a single transaction. a wallet listed twice
+    raises ValueError, and nothing is imported
+    """
+    await session.exec(
+        delete(SnapshotBalance).where(SnapshotBalance.snapshot_id == snapshot_id)
+    )
+    await session.exec(delete(Snapshot).where(Snapshot.snapshot_id == snapshot_id))
+
+    wallets = 0
+    batch = []
+    seen = set()
+    for wallet_address, balance in balances:
+        if wallet_address in seen:
+            raise ValueError(f"duplicate wallet_address: {wallet_address}")
+        seen.add(wallet_address)
+        batch.append(
+            {
+                "snapshot_id": snapshot_id,
+                "wallet_address": wallet_address,
+                "balance": balance,
+            }
+        )
+        if len(batch) >= batch_size:
+            await session.exec(insert(SnapshotBalance), params=batch)
+            wallets += len(batch)
+            batch = []
+    if batch:
+        await session.exec(insert(SnapshotBalance), params=batch)
+        wallets += len(batch)
+
+    session.add(
+        Snapshot(
+            snapshot_id=snapshot_id,
+            created_timestamp=datetime.now().timestamp(),
+            wallets=wallets,
+        )
+    )
+    await session.commit()
+    return wallets
+
+
+async def main():
+    from .database import engine
+
+    parser = argparse.ArgumentParser(
+        description="import a voting power snapshot from a CSV or Parquet file "
+        "with `wallet_address` and `balance` columns"
+    )
+    parser.add_argument(
+        "snapshot_id", help="proposal id, or token address for all its proposals"
+    )
+    parser.add_argument("path", help="snapshot file, .csv or .parquet")
+    parser.add_argument("--batch-size", type=int, default=SNAPSHOT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    snapshot_id = args.snapshot_id
+    if snapshot_id.startswith("0x"):
+        snapshot_id = normalize_address(snapshot_id)
+
+    async with AsyncSession(engine) as session:
+        try:
+            wallets = await import_snapshot(
+                session, snapshot_id, read_snapshot(args.path), args.batch_size
+            )
+        except ValueError as exc:
+            sys.exit(f"error: {exc}")
+    print(f"imported {wallets} balances into snapshot {snapshot_id}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+import asyncio
+
+from sqlalchemy import case, delete, func, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .cache import bump_versions, proposal_key
+from .events import queue_event
+from .schemas import Option, Proposal, Tally, Version, Vote, VotingStrategy
+
+
+async def add_to_tally(
+    session: AsyncSession, proposal_id: str, votes: list[tuple[Option, float]]
+):
+    """
+    count (option, weight) votes into the tally of a proposal.
+
+    meant to run in the same transaction as the vote insert, it also
+    invalidates the cached reads of the proposal and publishes the change to
+    its results streams once committed.
+    """
+    yes = [weight for option, weight in votes if option == Option.YES]
+    no = [weight for option, weight in votes if option != Option.YES]
+    delta = {
+        "yes": len(yes),
+        "no": len(no),
+        "yes_weight": sum(yes),
+        "no_weight": sum(no),
+    }
+    stmt = sqlite_insert(Tally).values(proposal_id=proposal_id, **delta)
+    columns = Tally.__table__.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[columns.proposal_id],
+        set_={
+            "yes": columns.yes + stmt.excluded.yes,
+            "no": columns.no + stmt.excluded.no,
+            "yes_weight": columns.yes_weight + stmt.excluded.yes_weight,
+            "no_weight": columns.no_weight + stmt.excluded.no_weight,
+        },
+    )
+    await session.exec(stmt)
+    key = proposal_key(proposal_id)
+    versions = await bump_versions(session, [key])
+    queue_event(session, proposal_id, {**delta, "version": versions[key]})
+
+
+async def get_tally(
+    session: AsyncSession, proposal_id: str, strategy: VotingStrategy | None = None
+) -> Tally:
+    """
+    tally of a proposal, empty when it has no votes or, given `strategy`, when
+    the proposal has another strategy
+    """
+    if strategy is None:
+        tally = await session.get(Tally, proposal_id)
+    else:
+        tally = (
+            await session.exec(
+                select(Tally)
+                .join(Proposal, Proposal.proposal_id == Tally.proposal_id)
+                .where(Tally.proposal_id == proposal_id)
+                .where(Proposal.strategy == strategy)
+            )
+        ).first()
+    return tally if tally else Tally(proposal_id=proposal_id)
+
+
+async def get_tallies(
+    session: AsyncSession, proposal_ids: list[str]
+) -> list[tuple[VotingStrategy, Tally]]:
+    """
+    strategy and tally of each existing proposal of `proposal_ids`, in order,
+    read in one query
+    """
+    rows = await session.exec(
+        select(Proposal.proposal_id, Proposal.strategy, Tally)
+        .outerjoin(Tally, Tally.proposal_id == Proposal.proposal_id)
+        .where(Proposal.proposal_id.in_(proposal_ids))
+    )
+    tallies = {
+        proposal_id: (strategy, tally if tally else Tally(proposal_id=proposal_id))
+        for proposal_id, strategy, tally in rows.all()
+    }
+    return [tallies[key] for key in proposal_ids if key in tallies]
+
+
+def get_winner(yes: float, no: float) -> str:
+    if yes > no:
+        return "yes"
+    if no > yes:
+        return "no"
+    if yes > 0:
+        return "draw"
+    return "invalid"
+
+
+def tally_results(strategy: VotingStrategy, tally: Tally) -> dict:
+    """
+    results of a proposal as served by its `/results` route
+    """
+    if strategy == VotingStrategy.TOKEN_WEIGHT:
+        return {
+            "proposal_id": tally.proposal_id,
+            "total_voting_power": tally.yes_weight + tally.no_weight,
+            "yes": tally.yes_weight,
+            "no": tally.no_weight,
+            "winner": get_winner(tally.yes_weight, tally.no_weight),
+        }
+    return {
+        "proposal_id": tally.proposal_id,
+        "# of votes": tally.yes + tally.no,
+        "yes": tally.yes,
+        "no": tally.no,
+        "winner": get_winner(tally.yes, tally.no),
+    }
+
+
+async def rebuild_tallies(session: AsyncSession):
+    """
+    recompute every tally from the vote tables
+    """
+    await session.exec(delete(Tally))
+    is_yes = Vote.option == Option.YES
+    totals = select(
+        Vote.proposal_id,
+        func.sum(case((is_yes, 1), else_=0)),
+        func.sum(case((is_yes, 0), else_=1)),
+        func.sum(case((is_yes, Vote.weight), else_=0.0)),
+        func.sum(case((is_yes, 0.0), else_=Vote.weight)),
+    ).group_by(Vote.proposal_id)
+    await session.exec(
+        insert(Tally).from_select(
+            ["proposal_id", "yes", "no", "yes_weight", "no_weight"], totals
+        )
+    )
+    await session.exec(
+        update(Version)
+        .where(Version.key.startswith(proposal_key("")))
+        .values(version=Version.version + 1)
+    )
+    await session.commit()
+
+
+async def main():
+    from .database import engine
+
+    async with AsyncSession(engine) as session:
+        await rebuild_tallies(session)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
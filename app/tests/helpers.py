@@ -0,0 +1,43 @@
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from eth_account.signers.local import LocalAccount
+from fastapi.testclient import TestClient
+
+
+def sign(account: LocalAccount, text: str) -> str:
+    """
+    personal_sign signature of `text`, as a wallet would send it
+    """
+    return Account.sign_message(encode_defunct(text=text), account.key).signature.hex()
+
+
+def login(
+    client: TestClient, account: LocalAccount | None = None
+) -> tuple[dict, LocalAccount]:
+    """
+    log a wallet in, a new one by default. returns its auth headers and account
+    """
+    account = account or Account.create()
+    nonce = client.post("/auth/request-nonce").json()["nonce"]
+    auth_res = client.post(
+        "/auth/login",
+        params={
+            "wallet_address": account.address,
+            "signed_message": nonce,
+            "signature": sign(account, nonce),
+        },
+    )
+    assert auth_res.status_code == 200
+    return {"Authorization": f"Bearer {auth_res.json()['token']}"}, account
+
+
+def create_proposal(
+    client: TestClient, headers: dict, path: str = "/proposals/", **params
+) -> str:
+    """
+    create a proposal as the logged in wallet, returns its id
+    """
+    params = {"title": "test proposal", "description": "test description", **params}
+    create_proposal_res = client.post(path, params=params, headers=headers)
+    assert create_proposal_res.status_code == 200
+    return create_proposal_res.json()["proposal_id"]
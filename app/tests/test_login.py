@@ -1,4 +1,14 @@
+import asyncio
+import time
+import jwt
+import pytest
+from config import ALGORITHM, SECRET_KEY
+from ..auth import Principal, TokenCache, verify_token
 from ..main import app
+from ..nonces import MemoryNonceStore, NonceStore
+from ..utils import checksum_address, is_eq_address, normalize_address
+from .helpers import create_proposal, login, sign
+from eth_account import Account
 from fastapi.testclient import TestClient
 from eth_account.messages import encode_defunct
 from web3 import Web3
@@ -110,3 +120,139 @@ def test_whoisme():
     check_res = client.post("/auth/whoisme", headers=headers)
 
     assert check_res.status_code == 200
+
+
+def test_login_malformed_signature_fail():
+    nonce = client.post("/auth/request-nonce").json()["nonce"]
+
+    auth_res = client.post(
+        "/auth/login",
+        params={
+            "wallet_address": Account.create().address,
+            "signed_message": nonce,
+            "signature": "not a signature",
+        },
+    )
+
+    assert auth_res.status_code == 401
+
+
+def test_token_cache_bounded_and_expiring():
+    cache = TokenCache(maxsize=2)
+    now = time.time()
+
+    cache.put("a", Principal(wallet_address="0xa", expires=now + 60))
+    cache.put("b", Principal(wallet_address="0xb", expires=now - 1))
+    cache.put("c", Principal(wallet_address="0xc", expires=now + 60))
+
+    # least recently used entry is evicted past maxsize
+    assert cache.get("a") is None
+    # expired entries are never served
+    assert cache.get("b") is None
+    assert cache.get("c").wallet_address == "0xc"
+
+
+def test_login_nonce_single_use():
+    account = Account.create()
+    nonce = client.post("/auth/request-nonce").json()["nonce"]
+    params = {
+        "wallet_address": account.address,
+        "signed_message": nonce,
+        "signature": sign(account, nonce),
+    }
+
+    assert client.post("/auth/login", params=params).status_code == 200
+    # replaying the same signed nonce is rejected
+    assert client.post("/auth/login", params=params).status_code == 401
+
+
+def test_memory_nonce_store_bounded_and_expiring():
+    store = MemoryNonceStore(ttl=60, maxsize=2)
+
+    first = asyncio.run(store.issue())
+    second = asyncio.run(store.issue())
+    third = asyncio.run(store.issue())
+
+    # oldest nonce is evicted past maxsize
+    assert len(store) == 2
+    assert not asyncio.run(store.consume(first))
+    assert asyncio.run(store.consume(second))
+    assert not asyncio.run(store.consume(second))
+
+    store.ttl = -1
+    expired = asyncio.run(store.issue())
+    assert not asyncio.run(store.consume(expired))
+    assert asyncio.run(store.consume(third))
+
+
+def test_nonce_store_interface():
+    class IssueOnly(NonceStore):
+        async def issue(self) -> str:
+            return "nonce"
+
+    # an incomplete store fails on construction, not on the first login
+    with pytest.raises(TypeError):
+        IssueOnly(ttl=60)
+
+
+def test_whoisme_lowercase_login():
+    account = Account.create()
+    nonce = client.post("/auth/request-nonce").json()["nonce"]
+
+    # address case sent by the client doesn't matter
+    auth_res = client.post(
+        "/auth/login",
+        params={
+            "wallet_address": account.address.lower(),
+            "signed_message": nonce,
+            "signature": sign(account, nonce),
+        },
+    )
+
+    jwt_token = auth_res.json()["token"]
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    check_res = client.post("/auth/whoisme", headers=headers)
+
+    assert check_res.status_code == 200
+    assert check_res.json()["wallet_address"] == account.address
+
+
+def test_mixed_case_token_address_normalized():
+    account = Account.create()
+    proposer_headers, _ = login(client)
+    proposal_id = create_proposal(client, proposer_headers)
+
+    # a token issued before addresses were normalized, then a current one
+    expires = time.time() + 60
+    for wallet_address in [account.address, account.address.lower()]:
+        token = jwt.encode(
+            {"wallet_address": wallet_address, "expires": expires},
+            SECRET_KEY,
+            algorithm=ALGORITHM,
+        )
+        assert verify_token(token).wallet_address == account.address.lower()
+        vote_res = client.post(
+            f"/proposals/{proposal_id}/vote",
+            params={"option": "yes"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        # one vote per wallet, whatever the case in the token
+        assert vote_res.status_code == (
+            200 if wallet_address == account.address else 422
+        )
+
+    invalid = jwt.encode(
+        {"wallet_address": "not an address", "expires": expires},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+    assert verify_token(invalid) is None
+
+
+def test_is_eq_address():
+    address = "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed"
+
+    assert normalize_address(address) == address.lower()
+    assert checksum_address(address.lower()) == address
+    assert is_eq_address(address, address.lower())
+    assert not is_eq_address(address, "0x" + "0" * 40)
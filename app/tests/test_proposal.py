@@ -1,4 +1,10 @@
+from datetime import datetime
+from uuid import uuid4
 from ..main import app
+from ..profiling import ProfilingMiddleware
+from ..routers.proposals import current_status
+from ..schemas import ProposalStatus
+from .helpers import create_proposal, login
 from fastapi.testclient import TestClient
 from eth_account.messages import encode_defunct
 from web3 import Web3
@@ -56,3 +62,119 @@ def test_create_proposal_fail():
         },
     )
     assert create_proposal_res.status_code == 403
+
+
+def test_proposal_status_derived_from_window():
+    now = datetime.now().timestamp()
+
+    assert current_status(now - 10, now + 10, now) == ProposalStatus.ACTIVE
+    # not started yet
+    assert current_status(now + 10, now + 20, now) == ProposalStatus.CLOSED
+    # expired
+    assert current_status(now - 20, now - 10, now) == ProposalStatus.CLOSED
+
+
+def test_get_proposals_paginated():
+    headers, account = login(client)
+    proposal_ids = [
+        create_proposal(client, headers, title=f"test proposal {i}") for i in range(3)
+    ]
+
+    params = {"proposer": account.address, "status": "active", "limit": 2}
+    first_page = client.get("/proposals/", params=params)
+    assert first_page.status_code == 200
+    assert [p["proposal_id"] for p in first_page.json()] == proposal_ids[:2]
+
+    cursor = first_page.headers["x-next-cursor"]
+    second_page = client.get("/proposals/", params={**params, "cursor": cursor})
+    assert second_page.status_code == 200
+    assert [p["proposal_id"] for p in second_page.json()] == proposal_ids[2:]
+    assert "x-next-cursor" not in second_page.headers
+
+
+def test_search_proposals():
+    headers, _ = login(client)
+    # a word no other test uses
+    word = f"treasury{uuid4().hex[:8]}"
+    proposal_ids = []
+    for title, description in [
+        ("fund the grants program", f"paid from the {word}"),
+        (f"{word} diversification", "sell part of the reserves"),
+        ("unrelated", "nothing to see"),
+    ]:
+        proposal_ids.append(
+            create_proposal(client, headers, title=title, description=description)
+        )
+
+    # title matches rank first
+    search_res = client.get("/proposals/search", params={"q": word})
+    assert search_res.status_code == 200
+    assert [p["proposal_id"] for p in search_res.json()] == [
+        proposal_ids[1],
+        proposal_ids[0],
+    ]
+
+    first_page = client.get(
+        "/proposals/search", params={"q": f"{word[:12]}*", "limit": 1}
+    )
+    assert [p["proposal_id"] for p in first_page.json()] == proposal_ids[1:2]
+    cursor = first_page.headers["x-next-cursor"]
+    second_page = client.get(
+        "/proposals/search", params={"q": f"{word[:12]}*", "limit": 1, "cursor": cursor}
+    )
+    assert [p["proposal_id"] for p in second_page.json()] == proposal_ids[:1]
+    assert "x-next-cursor" not in second_page.headers
+
+    # simple proposals only
+    token_weight_res = client.get("/proposals/token_weight/search", params={"q": word})
+    assert token_weight_res.json() == []
+
+    assert client.get("/proposals/search", params={"q": "-*"}).status_code == 422
+
+
+def test_metrics():
+    proposal_res = client.get("/proposals/unknown")
+    assert proposal_res.status_code == 200
+
+    metrics_res = client.get("/metrics")
+    assert metrics_res.status_code == 200
+    assert metrics_res.headers["content-type"].startswith("text/plain")
+
+    lines = metrics_res.text.splitlines()
+    route = 'method="GET",route="/proposals/{proposal_id}"'
+    assert any(
+        line.startswith(f'http_request_duration_seconds_count{{{route},status="200"}}')
+        for line in lines
+    )
+    statements = next(
+        line
+        for line in lines
+        if line.startswith(f"http_request_db_statements_sum{{{route}}}")
+    )
+    assert float(statements.split()[-1]) >= 1
+
+
+def test_profiled_request(tmp_path):
+    profiled_client = TestClient(
+        ProfilingMiddleware(app, token="secret", directory=str(tmp_path))
+    )
+
+    # without the header, nothing is profiled
+    proposal_res = profiled_client.get("/proposals/unknown")
+    assert proposal_res.status_code == 200
+    assert "x-profile" not in proposal_res.headers
+
+    proposal_res = profiled_client.get(
+        "/proposals/unknown", headers={"X-Profile": "wrong"}
+    )
+    assert proposal_res.status_code == 403
+
+    proposal_res = profiled_client.get(
+        "/proposals/unknown", headers={"X-Profile": "secret"}
+    )
+    assert proposal_res.status_code == 200
+    profile_id = proposal_res.headers["x-profile"]
+    assert (tmp_path / f"{profile_id}.pstats").exists()
+    summary = (tmp_path / f"{profile_id}.txt").read_text()
+    assert summary.startswith("GET /proposals/unknown 200")
+    assert "SELECT" in summary
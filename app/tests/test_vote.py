@@ -1,4 +1,42 @@
+import asyncio
+import json
+import sqlite3
+import pytest
+from datetime import datetime
+from uuid import uuid4
+from sqlalchemy import event as sqlalchemy_event
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from config import SQLITE_FILE
+from ..balances import (
+    ZERO_ADDRESS,
+    BalanceProvider,
+    BalanceUnavailable,
+    CachedBalanceProvider,
+    LocalBalanceProvider,
+    RPCBalanceProvider,
+)
+from ..cache import proposal_key, response_cache
+from ..database import engine, read_engine
+from ..events import results_broker
+from ..live import stream_results
+from ..schemas import (
+    Option,
+    Proposal,
+    ProposalStatus,
+    SnapshotBalance,
+    Vote,
+    VotingStrategy,
+)
+from ..signature import vote_message
+from ..tally import add_to_tally, get_tally
+from ..utils import checksum_address
+from ..write_queue import VoteWriteQueue
+from ..snapshots import get_snapshot_balance, import_snapshot, read_snapshot
 from ..main import app
+from ..routers import proposals, votes
+from .helpers import create_proposal, login, sign
+from eth_account import Account
 from fastapi.testclient import TestClient
 from eth_account.messages import encode_defunct
 from web3 import Web3
@@ -111,3 +149,518 @@ def test_create_vote_fail():
     )
 
     assert vote_res.status_code == 403
+
+
+def test_create_vote_twice_fail():
+    headers, _ = login(client)
+    proposal_id = create_proposal(client, headers)
+    endpoint = f"/proposals/{proposal_id}/vote"
+
+    vote_res = client.post(endpoint, params={"option": "yes"}, headers=headers)
+    assert vote_res.status_code == 200
+
+    # second vote is rejected by the unique index
+    vote_res = client.post(endpoint, params={"option": "no"}, headers=headers)
+    assert vote_res.status_code == 422
+
+
+def test_get_results_counts_votes():
+    headers, _ = login(client)
+    proposal_id = create_proposal(client, headers)
+    for option in ["yes", "yes", "no"]:
+        headers, _ = login(client)
+        vote_res = client.post(
+            f"/proposals/{proposal_id}/vote",
+            params={"option": option},
+            headers=headers,
+        )
+        assert vote_res.status_code == 200
+
+    results_res = client.get(f"/proposals/{proposal_id}/results")
+
+    assert results_res.status_code == 200
+    assert results_res.json() == {
+        "proposal_id": proposal_id,
+        "# of votes": 3,
+        "yes": 2,
+        "no": 1,
+        "winner": "yes",
+    }
+
+
+def test_export_votes():
+    headers, _ = login(client)
+    proposal_id = create_proposal(client, headers)
+    vote_res = client.post(
+        f"/proposals/{proposal_id}/vote",
+        params={"option": "no"},
+        headers=headers,
+    )
+    vote_id = vote_res.json()["vote_id"]
+
+    ndjson_res = client.get(f"/proposals/{proposal_id}/votes/export")
+    assert ndjson_res.status_code == 200
+    rows = [json.loads(line) for line in ndjson_res.text.splitlines()]
+    assert [(row["vote_id"], row["option"]) for row in rows] == [(vote_id, "no")]
+
+    csv_res = client.get(
+        f"/proposals/{proposal_id}/votes/export", params={"format": "csv"}
+    )
+    assert csv_res.status_code == 200
+    header, row = csv_res.text.splitlines()
+    assert header.startswith("vote_id,proposal_id")
+    assert row.startswith(f"{vote_id},{proposal_id}")
+
+
+class RecordingBalanceProvider(LocalBalanceProvider):
+    def __init__(self, balances):
+        super().__init__(balances)
+        self.calls = []
+
+    async def get_balances(self, token_address, wallet_addresses):
+        self.calls.append((token_address, list(wallet_addresses)))
+        return await super().get_balances(token_address, wallet_addresses)
+
+
+def test_cached_balance_provider_batches_lookups():
+    local = RecordingBalanceProvider(
+        {("0xtoken", "0xa"): 10.0, ("0xtoken", "0xb"): 0.0}
+    )
+    provider = CachedBalanceProvider(
+        local, ttl=60, maxsize=10, deadline=1, batch_window=0.01, batch_size=10
+    )
+
+    async def lookups():
+        # concurrent misses for the same token share one provider call
+        first = await asyncio.gather(
+            provider.get_balance("0xtoken", "0xa"),
+            provider.get_balance("0xtoken", "0xb"),
+            provider.get_balance("0xtoken", "0xa"),
+        )
+        # hits are served from the cache
+        second = await provider.get_balances("0xtoken", ["0xa", "0xb"])
+        return first, second
+
+    first, second = asyncio.run(lookups())
+
+    assert first == [10.0, 0.0, 10.0]
+    assert second == {"0xa": 10.0, "0xb": 0.0}
+    assert local.calls == [("0xtoken", ["0xa", "0xb"])]
+
+
+def test_balance_provider_interface():
+    class SingleLookup(BalanceProvider):
+        async def get_balance(self, token_address, wallet_address):
+            return 0.0
+
+    # an incomplete provider fails on construction, not on the first vote
+    with pytest.raises(TypeError):
+        SingleLookup()
+
+
+def test_rpc_balance_provider_errors_unavailable():
+    class Response:
+        def __init__(self, items):
+            self.items = items
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            pass
+
+        def raise_for_status(self):
+            pass
+
+        async def json(self):
+            return self.items
+
+    class Session:
+        def post(self, url, json):
+            # the first balance is fine, the second call failed
+            return Response(
+                [
+                    {"id": 0, "result": "0x1"},
+                    {"id": 1, "error": {"code": -32000, "message": "busy"}},
+                ]
+            )
+
+    local = RPCBalanceProvider("http://rpc")
+    local._session = Session()
+    provider = CachedBalanceProvider(
+        local, ttl=60, maxsize=10, deadline=1, batch_window=0, batch_size=10
+    )
+
+    async def lookups():
+        return await asyncio.gather(
+            provider.get_balance(ZERO_ADDRESS, "0xa"),
+            provider.get_balance(ZERO_ADDRESS, "0xb"),
+            return_exceptions=True,
+        )
+
+    # a failed call fails the lookup instead of counting as a zero balance
+    for result in asyncio.run(lookups()):
+        assert isinstance(result, BalanceUnavailable)
+    assert len(provider._cache) == 0
+
+
+def test_snapshot_voting_power():
+    proposal = Proposal(
+        proposal_id=uuid4().hex,
+        title="test proposal",
+        description="test description",
+        proposer="0x" + "1" * 40,
+        strategy=VotingStrategy.TOKEN_WEIGHT,
+        token_address="0x" + uuid4().hex + "0" * 8,
+        created_timestamp=0,
+        start_timestamp=0,
+        end_timestamp=0,
+        status=ProposalStatus.CLOSED,
+    )
+    voter, absent = "0x" + "a" * 40, "0x" + "b" * 40
+
+    async def lookups():
+        async with AsyncSession(engine) as session:
+            before = await get_snapshot_balance(session, proposal, voter)
+            await import_snapshot(
+                session, proposal.token_address, iter([(voter, 5.0)]), batch_size=1
+            )
+            token_snapshot = await get_snapshot_balance(session, proposal, voter)
+            # a snapshot of the proposal itself wins over the token's
+            await import_snapshot(session, proposal.proposal_id, iter([(voter, 7.0)]))
+            proposal_snapshot = await get_snapshot_balance(session, proposal, voter)
+            missing = await get_snapshot_balance(session, proposal, absent)
+        return before, token_snapshot, proposal_snapshot, missing
+
+    assert asyncio.run(lookups()) == (None, 5.0, 7.0, 0.0)
+
+
+def test_snapshot_duplicate_wallet(tmp_path):
+    snapshot_id = uuid4().hex
+    wallet = "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed"
+    path = tmp_path / "balances.csv"
+    path.write_text(f"wallet_address,balance\n{wallet},1\n{wallet.lower()},2\n")
+
+    async def imports():
+        async with AsyncSession(engine) as session:
+            await import_snapshot(session, snapshot_id, iter([(wallet.lower(), 5.0)]))
+        async with AsyncSession(engine) as session:
+            with pytest.raises(ValueError, match=wallet.lower()):
+                await import_snapshot(
+                    session, snapshot_id, read_snapshot(str(path)), batch_size=1
+                )
+        async with AsyncSession(engine) as session:
+            return await session.get(SnapshotBalance, (snapshot_id, wallet.lower()))
+
+    # the same wallet in another case is a duplicate, the former snapshot stays
+    assert asyncio.run(imports()).balance == 5.0
+
+
+def test_cast_votes_batch():
+    headers, _ = login(client)
+    proposal_id = create_proposal(client, headers)
+
+    votes = []
+    for option in ["yes", "no", "yes"]:
+        voter = Account.create()
+        votes.append(
+            {
+                "voter_address": voter.address,
+                "option": option,
+                "signature": sign(voter, vote_message(proposal_id, option)),
+            }
+        )
+    # signed for "yes", submitted as "no"
+    votes.append(dict(votes[0], option="no"))
+    # same voter twice in the batch
+    votes.append(votes[1])
+
+    batch_res = client.post(f"/proposals/{proposal_id}/votes/batch", json=votes)
+
+    assert batch_res.status_code == 200
+    assert [result["status"] for result in batch_res.json()] == [
+        "accepted",
+        "accepted",
+        "accepted",
+        "rejected",
+        "rejected",
+    ]
+
+    # resubmitting only hits the unique index
+    batch_res = client.post(f"/proposals/{proposal_id}/votes/batch", json=votes[:1])
+    assert batch_res.json()[0]["detail"] == "You could only vote once."
+
+    results_res = client.get(f"/proposals/{proposal_id}/results")
+    assert results_res.json()["yes"] == 2
+    assert results_res.json()["no"] == 1
+
+
+def test_vote_write_queue_group_commit():
+    proposal_id = uuid4().hex
+    voters = [checksum_address("0x" + uuid4().hex + "a" * 8) for _ in range(3)]
+    queue = VoteWriteQueue(max_batch=10, max_delay=0.01)
+
+    def vote(voter, option):
+        return Vote(
+            proposal_id=proposal_id,
+            voter_address=voter,
+            voted_timestamp=0,
+            option=option,
+        )
+
+    async def submit():
+        inserted = await asyncio.gather(
+            queue.submit(vote(voters[0], Option.YES)),
+            queue.submit(vote(voters[1], Option.NO)),
+            queue.submit(vote(voters[2], Option.YES)),
+            # same voter again within the batch, in another case
+            queue.submit(vote(voters[0].lower(), Option.NO)),
+        )
+        await queue.stop()
+        async with AsyncSession(engine) as session:
+            tally = await get_tally(session, proposal_id)
+            stored = await session.exec(
+                select(Vote.voter_address).where(Vote.proposal_id == proposal_id)
+            )
+            stored = sorted(stored.all())
+        return inserted, (tally.yes, tally.no), stored
+
+    assert asyncio.run(submit()) == (
+        [True, True, True, False],
+        (2, 1),
+        sorted(voter.lower() for voter in voters),
+    )
+
+
+def test_results_etag_changes_on_vote():
+    headers, _ = login(client)
+    proposal_id = create_proposal(client, headers)
+    endpoint = f"/proposals/{proposal_id}/results"
+
+    results_res = client.get(endpoint)
+    assert results_res.status_code == 200
+    assert results_res.json()["# of votes"] == 0
+    etag = results_res.headers["etag"]
+
+    # unchanged: nothing but the validator comes back
+    results_res = client.get(endpoint, headers={"If-None-Match": etag})
+    assert results_res.status_code == 304
+    assert results_res.headers["etag"] == etag
+    assert results_res.content == b""
+
+    vote_res = client.post(
+        f"/proposals/{proposal_id}/vote",
+        params={"option": "yes"},
+        headers=headers,
+    )
+    assert vote_res.status_code == 200
+
+    results_res = client.get(endpoint, headers={"If-None-Match": etag})
+    assert results_res.status_code == 200
+    assert results_res.headers["etag"] != etag
+    assert results_res.json()["# of votes"] == 1
+
+
+def test_bulk_results():
+    headers, _ = login(client)
+    proposal_id = create_proposal(client, headers)
+    token_weight_proposal_id = create_proposal(
+        client,
+        headers,
+        "/proposals/token_weight/",
+        token_address="0x0000000000000000000000000000000000000000",
+    )
+
+    # request order, duplicates and unknown proposals dropped
+    params = {
+        "proposal_id": [token_weight_proposal_id, proposal_id, "unknown", proposal_id]
+    }
+    results_res = client.get("/results", params=params)
+    assert results_res.status_code == 200
+    assert results_res.json() == [
+        client.get(
+            f"/proposals/token_weight/{token_weight_proposal_id}/results"
+        ).json(),
+        client.get(f"/proposals/{proposal_id}/results").json(),
+    ]
+    etag = results_res.headers["etag"]
+
+    vote_res = client.post(
+        f"/proposals/{proposal_id}/vote",
+        params={"option": "yes"},
+        headers=headers,
+    )
+    assert vote_res.status_code == 200
+
+    results_res = client.get("/results", params=params, headers={"If-None-Match": etag})
+    assert results_res.status_code == 200
+    assert results_res.json()[1]["# of votes"] == 1
+
+    assert client.get("/results").status_code == 422
+
+
+def test_vote_routes_scoped_by_strategy():
+    headers, _ = login(client)
+    proposal_id = create_proposal(client, headers)
+    vote_res = client.post(
+        f"/proposals/{proposal_id}/vote",
+        params={"option": "yes"},
+        headers=headers,
+    )
+    assert vote_res.status_code == 200
+    assert len(client.get(f"/proposals/{proposal_id}/votes").json()) == 1
+
+    # a plain proposal has no token weight votes or results, and vice versa
+    endpoint = f"/proposals/token_weight/{proposal_id}"
+    assert client.get(endpoint).json() is None
+    assert client.get(f"{endpoint}/votes").json() == []
+    assert client.get(f"{endpoint}/votes/export").text == ""
+    assert client.get(f"{endpoint}/results").json()["total_voting_power"] == 0
+
+    token_weight_proposal_id = create_proposal(
+        client,
+        headers,
+        "/proposals/token_weight/",
+        token_address="0x0000000000000000000000000000000000000000",
+    )
+    assert client.get(f"/proposals/{token_weight_proposal_id}").json() is None
+    assert client.get(f"/proposals/{token_weight_proposal_id}/votes").json() == []
+    results_res = client.get(f"/proposals/{token_weight_proposal_id}/results")
+    assert results_res.json()["# of votes"] == 0
+
+
+def test_fast_json_responses_match(monkeypatch):
+    headers, account = login(client)
+    proposal_id = create_proposal(client, headers)
+    client.post(
+        f"/proposals/{proposal_id}/vote",
+        params={"option": "yes"},
+        headers=headers,
+    )
+
+    # token_address is the one optional address field
+    create_proposal(
+        client,
+        headers,
+        "/proposals/token_weight/",
+        token_address="0x6b175474e89094c44da98b954eedeac495271d0f",
+    )
+
+    requests = [
+        (f"/proposals/{proposal_id}/votes", {}),
+        ("/proposals/", {"proposer": account.address}),
+        ("/proposals/", {"limit": 1}),
+        ("/proposals/token_weight/", {"proposer": account.address}),
+    ]
+
+    def fetch():
+        response_cache.clear()
+        return [client.get(url, params=params) for url, params in requests]
+
+    expected = fetch()
+    monkeypatch.setattr(votes, "FAST_JSON_RESPONSES", True)
+    monkeypatch.setattr(proposals, "FAST_JSON_RESPONSES", True)
+    for fast, slow in zip(fetch(), expected):
+        assert fast.status_code == 200
+        assert fast.json() == slow.json()
+        assert fast.headers.get("x-next-cursor") == slow.headers.get("x-next-cursor")
+
+
+def test_results_stream():
+    now = datetime.now().timestamp()
+    proposal = Proposal(
+        proposal_id=uuid4().hex,
+        title="test proposal",
+        description="test description",
+        proposer="0x" + "1" * 40,
+        created_timestamp=now,
+        start_timestamp=now,
+        end_timestamp=now + 60,
+        status=ProposalStatus.ACTIVE,
+    )
+
+    async def follow():
+        stream = stream_results(proposal)
+        events = [await anext(stream)]
+        async with AsyncSession(engine) as session:
+            await add_to_tally(session, proposal.proposal_id, [(Option.YES, 2.0)])
+            # nothing is published before the commit
+            await session.rollback()
+            await add_to_tally(session, proposal.proposal_id, [(Option.NO, 1.0)])
+            await session.commit()
+        events.append(await anext(stream))
+        await stream.aclose()
+        return events
+
+    snapshot, delta = asyncio.run(follow())
+
+    assert snapshot.startswith("event: results\n")
+    assert json.loads(snapshot.split("data: ")[1]) == {
+        "proposal_id": proposal.proposal_id,
+        "status": "active",
+        "yes": 0,
+        "no": 0,
+        "yes_weight": 0.0,
+        "no_weight": 0.0,
+    }
+    assert delta.startswith("event: tally\n")
+    data = json.loads(delta.split("data: ")[1])
+    assert (data["yes"], data["no"], data["no_weight"]) == (0, 1, 1.0)
+    assert len(results_broker) == 0
+
+
+def test_results_stream_vote_during_snapshot():
+    now = datetime.now().timestamp()
+    proposal = Proposal(
+        proposal_id=uuid4().hex,
+        title="test proposal",
+        description="test description",
+        proposer="0x" + "1" * 40,
+        created_timestamp=now,
+        start_timestamp=now,
+        end_timestamp=now + 60,
+        status=ProposalStatus.ACTIVE,
+    )
+    key = proposal_key(proposal.proposal_id)
+    committed = []
+
+    def commit_vote(*args):
+        # a vote committed by another writer while the snapshot is being read
+        if committed:
+            return
+        with sqlite3.connect(SQLITE_FILE, timeout=5) as connection:
+            connection.execute(
+                "INSERT INTO tally (proposal_id, yes, no, yes_weight, no_weight) "
+                "VALUES (?, 1, 0, 1.0, 0.0)",
+                (proposal.proposal_id,),
+            )
+            connection.execute(
+                "INSERT INTO version (key, version) VALUES (?, 1)", (key,)
+            )
+        committed.append(True)
+        results_broker.publish(
+            proposal.proposal_id,
+            {"yes": 1, "no": 0, "yes_weight": 1.0, "no_weight": 0.0, "version": 1},
+        )
+
+    async def follow():
+        stream = stream_results(proposal)
+        sqlalchemy_event.listen(
+            read_engine.sync_engine, "after_cursor_execute", commit_vote
+        )
+        try:
+            events = [await anext(stream)]
+        finally:
+            sqlalchemy_event.remove(
+                read_engine.sync_engine, "after_cursor_execute", commit_vote
+            )
+        events.append(await asyncio.wait_for(anext(stream), 1))
+        await stream.aclose()
+        return events
+
+    snapshot, delta = asyncio.run(follow())
+
+    # the vote is either in the snapshot or delivered after it, never lost
+    assert json.loads(snapshot.split("data: ")[1])["yes"] == 0
+    assert delta.startswith("event: tally\n")
+    assert json.loads(delta.split("data: ")[1])["yes"] == 1
@@ -0,0 +1,12 @@
+from typing import Annotated
+
+from pydantic import AfterValidator, PlainSerializer
+
+from .utils import checksum_address, normalize_address
+
+# lowercase when parsed from a request, checksummed when serialized
+Address = Annotated[
+    str,
+    AfterValidator(normalize_address),
+    PlainSerializer(checksum_address, return_type=str),
+]
@@ -1,8 +1,36 @@
-from web3 import Web3
+import re
+from functools import lru_cache
 
+from eth_hash.auto import keccak
 
-def is_eq_address(addr1: str, addr2: str) -> bool:
-    addr1_checksum = Web3.to_checksum_address(addr1)
-    addr2_checksum = Web3.to_checksum_address(addr2)
+from config import CHECKSUM_CACHE_SIZE
+
+ADDRESS_PATTERN = re.compile(r"^0x[0-9a-fA-F]{40}$")
+
+
+def normalize_address(address: str) -> str:
+    """
+    canonical form of an address: lowercase hex with the 0x prefix.
+    stored and compared everywhere, checksum is only applied on output.
+    """
+    if not ADDRESS_PATTERN.match(address):
+        raise ValueError(f"Invalid address: {address}")
+    return address.lower()
 
-    return addr1_checksum == addr2_checksum
+
+@lru_cache(maxsize=CHECKSUM_CACHE_SIZE)
+def checksum_address(address: str) -> str:
+    """
+    EIP-55 mixed-case checksum, hashing with eth_hash alone instead of
+    loading eth_utils
+    """
+    hex_address = address.lower().removeprefix("0x")
+    digest = keccak(hex_address.encode()).hex()
+    return "0x" + "".join(
+        char.upper() if int(nibble, 16) >= 8 else char
+        for char, nibble in zip(hex_address, digest)
+    )
+
+
+def is_eq_address(addr1: str, addr2: str) -> bool:
+    return normalize_address(addr1) == normalize_address(addr2)
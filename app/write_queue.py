@@ -0,0 +1,125 @@
+import asyncio
+from contextlib import suppress
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import VOTE_GROUP_COMMIT_DELAY_SECONDS, VOTE_GROUP_COMMIT_SIZE
+from .database import engine
+from .schemas import Vote
+from .tally import add_to_tally
+from .utils import normalize_address
+
+
+def vote_row(vote: Vote) -> dict:
+    """
+    insert params of a vote, from its raw attributes. `model_dump()` would
+    checksum the address, which the lowercase unique vote index never matches
+    """
+    row = {column.name: getattr(vote, column.name) for column in Vote.__table__.c}
+    row["voter_address"] = normalize_address(row["voter_address"])
+    return row
+
+
+class VoteWriteQueue:
+    """
+    group commit for votes: a single writer task inserts whatever was queued
+    within `max_delay` seconds (at most `max_batch` votes) in one transaction,
+    then resolves every caller of that batch at once.
+    """
+
+    def __init__(self, max_batch: int, max_delay: float):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue | None = None
+        self._writer: asyncio.Task | None = None
+
+    def start(self):
+        if (
+            self._writer is None
+            or self._writer.done()
+            or self._writer.get_loop() is not asyncio.get_running_loop()
+        ):
+            self._queue = asyncio.Queue()
+            self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._writer is None:
+            return
+        # flush what is already queued, then stop
+        await self._queue.put(None)
+        with suppress(asyncio.CancelledError):
+            await self._writer
+        self._writer = None
+
+    async def submit(self, vote: Vote) -> bool:
+        """
+        queue a vote and wait until its batch is committed.
+        returns False if the voter had already voted on the proposal.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((vote, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        try:
+            inserted = await self._commit(batch)
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for vote, future in batch:
+            if not future.done():
+                future.set_result(vote.vote_id in inserted)
+
+    async def _commit(self, batch: list) -> set[str]:
+        votes = [vote for vote, _ in batch]
+        async with AsyncSession(engine) as session:
+            # a second vote of the same voter is dropped by the unique index
+            result = await session.exec(
+                sqlite_insert(Vote).on_conflict_do_nothing().returning(Vote.vote_id),
+                params=[vote_row(vote) for vote in votes],
+            )
+            inserted = set(result.scalars().all())
+
+            tallies: dict[str, list] = {}
+            for vote in votes:
+                if vote.vote_id in inserted:
+                    tallies.setdefault(vote.proposal_id, []).append(
+                        (vote.option, vote.weight)
+                    )
+            for proposal_id, tally in tallies.items():
+                await add_to_tally(session, proposal_id, tally)
+            await session.commit()
+        return inserted
+
+
+vote_write_queue = VoteWriteQueue(
+    VOTE_GROUP_COMMIT_SIZE, VOTE_GROUP_COMMIT_DELAY_SECONDS
+)
@@ -0,0 +1,140 @@
+"""
+Cold start of the app, each run in a fresh interpreter.
+
+$ python -m benchmarks.coldstart [--runs 5] [--importtime 15] [--save FILE]
+
+Reports, per phase: importing `app.main`, the lifespan startup, the first
+request (`GET /proposals/`) and the first signature recovery, which loads
+the deferred signing modules. The first run starts on an empty database,
+the others find its schema up to date. --importtime lists the slowest
+top-level imports, as measured by `python -X importtime`.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PHASES = ["import", "startup", "first_request", "first_signature"]
+
+
+def child(message: str, signature: str):
+    import time
+
+    start = time.perf_counter()
+    from app.main import app
+
+    timings = {"import": time.perf_counter() - start}
+
+    import asyncio
+
+    import httpx
+
+    from app.signature import recover_address
+
+    async def boot():
+        start = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            timings["startup"] = time.perf_counter() - start
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://benchmark"
+            ) as client:
+                start = time.perf_counter()
+                response = await client.get("/proposals/")
+                timings["first_request"] = time.perf_counter() - start
+                assert response.status_code == 200
+
+    asyncio.run(boot())
+
+    start = time.perf_counter()
+    assert recover_address(message, signature) is not None
+    timings["first_signature"] = time.perf_counter() - start
+    print(json.dumps(timings))
+
+
+def run_child(env: dict, message: str, signature: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.coldstart", "--child", message, signature],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def slowest_imports(env: dict, count: int) -> list[tuple[str, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # children are listed before their parent, indented two more spaces
+    imports, children = [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = len(name) - len(name.lstrip())
+        if depth == 3:
+            children.append((name.strip(), int(cumulative)))
+        elif depth == 1:
+            if name.strip() == "app.main":
+                imports = children
+            children = []
+    return sorted(imports, key=lambda item: item[1], reverse=True)[:count]
+
+
+def main():
+    if sys.argv[1:2] == ["--child"]:
+        child(*sys.argv[2:4])
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", type=int, metavar="COUNT", default=0)
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON")
+    args = parser.parse_args()
+
+    from eth_account import Account
+    from eth_account.messages import encode_defunct
+
+    account = Account.create()
+    message = "coldstart"
+    signature = Account.sign_message(
+        encode_defunct(text=message), account.key
+    ).signature.hex()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = {**os.environ, "SQLITE_FILE": os.path.join(directory, "bench.db")}
+        first = run_child(env, message, signature)
+        runs = [run_child(env, message, signature) for _ in range(args.runs)]
+        imports = slowest_imports(env, args.importtime) if args.importtime else []
+
+    results = {
+        "empty_database": {phase: first[phase] * 1000 for phase in PHASES},
+        "median": {
+            phase: statistics.median(run[phase] for run in runs) * 1000
+            for phase in PHASES
+        },
+    }
+    for name, timings in results.items():
+        print(
+            f"{name + ':':<16}"
+            + "".join(f"  {phase} {timings[phase]:>7.1f}ms" for phase in PHASES)
+        )
+    for name, microseconds in imports:
+        print(f"  {name:<40} {microseconds / 1000:>7.1f}ms")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Load benchmark of the whole API, in process and offline.
+
+$ python -m benchmarks.load [--scenarios login_storm vote_burst results_polling]
+    [--requests 500] [--concurrency 50] [--save FILE] [--baseline FILE]
+
+Requests go through the ASGI transport to a throwaway database, wallets and
+signatures are generated locally. Reports throughput and p50/p95/p99 latency
+per route. With --baseline, exits non-zero when a route is slower or serves
+fewer requests per second than the baseline by more than --tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# the app binds its database on import, point it at a throwaway one first
+_database_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault("SQLITE_FILE", os.path.join(_database_dir.name, "bench.db"))
+
+import httpx  # noqa: E402
+from eth_account import Account  # noqa: E402
+from eth_account.messages import encode_defunct  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.signature import vote_message  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+class Recorder:
+    """
+    latency of every request, by route template
+    """
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def request(
+        self, client, route: str, method: str, url: str, expect=(200,), **kwargs
+    ) -> httpx.Response:
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[route].append(time.perf_counter() - start)
+        if response.status_code not in expect:
+            self.errors[route] += 1
+        return response
+
+
+def percentile(values: list[float], q: float) -> float:
+    # nearest rank on sorted values
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    routes = {}
+    for route, latencies in recorder.latencies.items():
+        latencies = sorted(latencies)
+        routes[route] = {
+            "requests": len(latencies),
+            "errors": recorder.errors[route],
+            "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+    return routes
+
+
+async def run_concurrently(count: int, concurrency: int, job):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(i):
+        async with semaphore:
+            await job(i)
+
+    await asyncio.gather(*(run(i) for i in range(count)))
+
+
+async def login(client, recorder: Recorder, account) -> dict:
+    response = await recorder.request(
+        client, "POST /auth/request-nonce", "POST", "/auth/request-nonce"
+    )
+    nonce = response.json()["nonce"]
+    signed = Account.sign_message(encode_defunct(text=nonce), account.key)
+    response = await recorder.request(
+        client,
+        "POST /auth/login",
+        "POST",
+        "/auth/login",
+        params={
+            "wallet_address": account.address,
+            "signed_message": nonce,
+            "signature": signed.signature.hex(),
+        },
+    )
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+async def create_proposal(client) -> str:
+    headers = await login(client, Recorder(), Account.create())
+    response = await client.post(
+        "/proposals/",
+        params={"title": "benchmark", "description": "benchmark"},
+        headers=headers,
+    )
+    return response.json()["proposal_id"]
+
+
+async def login_storm(client, recorder: Recorder, args):
+    """
+    many wallets logging in at once
+    """
+    accounts = [Account.create() for _ in range(args.requests)]
+
+    async def job(i):
+        await login(client, recorder, accounts[i])
+
+    return job
+
+
+async def vote_burst(client, recorder: Recorder, args):
+    """
+    every voter of one proposal voting at once
+    """
+    proposal_id = await create_proposal(client)
+    setup = Recorder()
+    voters = [
+        await login(client, setup, Account.create()) for _ in range(args.requests)
+    ]
+
+    async def job(i):
+        await recorder.request(
+            client,
+            "POST /proposals/{proposal_id}/vote",
+            "POST",
+            f"/proposals/{proposal_id}/vote",
+            params={"option": "yes" if i % 2 else "no"},
+            headers=voters[i],
+        )
+
+    return job
+
+
+async def results_polling(client, recorder: Recorder, args):
+    """
+    clients polling the results of a voted proposal, revalidating with ETags
+    """
+    proposal_id = await create_proposal(client)
+    votes = []
+    for i in range(100):
+        voter = Account.create()
+        option = "yes" if i % 2 else "no"
+        message = encode_defunct(text=vote_message(proposal_id, option))
+        votes.append(
+            {
+                "voter_address": voter.address,
+                "option": option,
+                "signature": Account.sign_message(message, voter.key).signature.hex(),
+            }
+        )
+    await client.post(f"/proposals/{proposal_id}/votes/batch", json=votes)
+    url = f"/proposals/{proposal_id}/results"
+
+    async def job(i):
+        response = await recorder.request(
+            client, "GET /proposals/{proposal_id}/results", "GET", url
+        )
+        await recorder.request(
+            client,
+            "GET /proposals/{proposal_id}/results If-None-Match",
+            "GET",
+            url,
+            expect=(304,),
+            headers={"If-None-Match": response.headers["etag"]},
+        )
+
+    return job
+
+
+SCENARIOS = {
+    "login_storm": login_storm,
+    "vote_burst": vote_burst,
+    "results_polling": results_polling,
+}
+
+
+async def run(args) -> dict:
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark"
+        ) as client:
+            for name in args.scenarios:
+                recorder = Recorder()
+                job = await SCENARIOS[name](client, recorder, args)
+                start = time.perf_counter()
+                await run_concurrently(args.requests, args.concurrency, job)
+                results[name] = summarize(recorder, time.perf_counter() - start)
+    return results
+
+
+def print_results(results: dict):
+    for name, routes in results.items():
+        print(f"{name}:")
+        for route, stats in routes.items():
+            print(
+                f"  {route:<55} {stats['rps']:>8.0f} req/s"
+                f"  p50 {stats['p50_ms']:>7.1f}ms"
+                f"  p95 {stats['p95_ms']:>7.1f}ms"
+                f"  p99 {stats['p99_ms']:>7.1f}ms"
+                f"  errors {stats['errors']}"
+            )
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    routes that regressed against the baseline
+    """
+    regressions = []
+    for name, routes in results.items():
+        for route, stats in routes.items():
+            base = baseline.get(name, {}).get(route)
+            if base is None:
+                continue
+            if stats["errors"] > base["errors"]:
+                regressions.append(f"{name} {route}: {stats['errors']} errors")
+            if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{name} {route}: p95 {stats['p95_ms']:.1f}ms, "
+                    f"baseline {base['p95_ms']:.1f}ms"
+                )
+            if stats["rps"] < base["rps"] * (1 - tolerance):
+                regressions.append(
+                    f"{name} {route}: {stats['rps']:.0f} req/s, "
+                    f"baseline {base['rps']:.0f} req/s"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON")
+    parser.add_argument(
+        "--baseline", metavar="FILE", nargs="?", const=BASELINE, default=None
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Microbenchmark for the signature recovery behind `/auth/login`.
+
+$ python -m benchmarks.signature [--logins 2000] [--workers 1 2 4]
+
+Reports logins per second for a single core, then through the signature
+executor with each worker count, normalised per worker.
+"""
+
+import argparse
+import asyncio
+import time
+from uuid import uuid4
+
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+import config
+from app import signature
+
+
+def make_logins(count: int) -> list[tuple[str, str, str]]:
+    logins = []
+    for _ in range(count):
+        account = Account.create()
+        nonce = uuid4().hex
+        signed = Account.sign_message(encode_defunct(text=nonce), account.key)
+        logins.append((account.address, nonce, signed.signature.hex()))
+    return logins
+
+
+def bench_inline(logins) -> float:
+    start = time.perf_counter()
+    for address, nonce, sig in logins:
+        assert signature.recover_address(nonce, sig) == address
+    return len(logins) / (time.perf_counter() - start)
+
+
+async def bench_executor(logins) -> float:
+    # warm up the pool so worker start up is not measured
+    await signature.recover_address_async(logins[0][1], logins[0][2])
+
+    start = time.perf_counter()
+    recovered = await asyncio.gather(
+        *(signature.recover_address_async(nonce, sig) for _, nonce, sig in logins)
+    )
+    elapsed = time.perf_counter() - start
+    assert recovered == [address for address, _, _ in logins]
+    return len(logins) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--executor", choices=["thread", "process"], default=config.SIGNATURE_EXECUTOR
+    )
+    args = parser.parse_args()
+
+    logins = make_logins(args.logins)
+    print(f"backend: {type(signature.get_keys().backend).__name__}")
+    print(f"inline: {bench_inline(logins):.0f} logins/s/core")
+
+    signature.SIGNATURE_EXECUTOR = args.executor
+    for workers in args.workers:
+        signature.SIGNATURE_WORKERS = workers
+        rate = asyncio.run(bench_executor(logins))
+        signature.shutdown_executor()
+        print(
+            f"{args.executor} x{workers}: {rate:.0f} logins/s, "
+            f"{rate / workers:.0f} logins/s/core"
+        )
+
+
+if __name__ == "__main__":
+    main()
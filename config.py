@@ -2,6 +2,200 @@
 JWT config
 """
 
+import os
+
 TOKEN_DURATION_MINUTES = 120
 SECRET_KEY = "221a59d2ecd05c5d9619be158578384415288dcccb66b3b8b184297d76f9db75"
 ALGORITHM = "HS256"
+
+"""
+Proposal status sweeper config
+"""
+
+STATUS_SWEEP_INTERVAL_SECONDS = 30.0
+
+"""
+Pagination config
+"""
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+"""
+Vote export config
+"""
+
+EXPORT_BATCH_SIZE = 1000
+
+"""
+Signature recovery config
+
+SIGNATURE_BACKEND: import path of the eth_keys backend, None picks
+`CoinCurveECCBackend` when `coincurve` is installed and the pure python
+`NativeECCBackend` otherwise.
+SIGNATURE_EXECUTOR: "thread" or "process". The native backend holds the GIL,
+use "process" to spread recovery over cores without coincurve.
+"""
+
+SIGNATURE_BACKEND = None
+SIGNATURE_EXECUTOR = "thread"
+SIGNATURE_WORKERS = 4
+
+"""
+Verified JWT cache config
+"""
+
+TOKEN_CACHE_SIZE = 10_000
+
+"""
+Login nonce config
+
+NONCE_STORE: "memory" keeps nonces in the worker process, "sqlite" shares
+them between workers through the database.
+"""
+
+NONCE_STORE = "memory"
+NONCE_TTL_SECONDS = 300.0
+NONCE_STORE_SIZE = 100_000
+NONCE_PURGE_EVERY = 1000
+
+"""
+Address formatting config
+"""
+
+CHECKSUM_CACHE_SIZE = 65_536
+
+"""
+Token balance config
+
+BALANCE_PROVIDER: "local" draws in-process stand-in balances, "rpc" reads
+ERC-20 (or native, for the zero address) balances from `BALANCE_RPC_URL`.
+"""
+
+BALANCE_PROVIDER = "local"
+BALANCE_RPC_URL = os.getenv("MAINNET_RPC", "https://eth.llamarpc.com")
+BALANCE_CACHE_TTL_SECONDS = 60.0
+BALANCE_CACHE_SIZE = 100_000
+BALANCE_DEADLINE_SECONDS = 2.0
+BALANCE_BATCH_WINDOW_SECONDS = 0.005
+BALANCE_BATCH_SIZE = 100
+
+"""
+Voting power snapshot config
+"""
+
+SNAPSHOT_BATCH_SIZE = 10_000
+
+"""
+Batch vote config
+"""
+
+MAX_VOTE_BATCH_SIZE = 1000
+
+"""
+Bulk results config
+"""
+
+MAX_BULK_RESULTS = 100
+
+"""
+SQLite storage config
+
+SQLITE_PROFILE picks the PRAGMAs applied to every connection from
+SQLITE_PROFILES. Writes go through a pool of DB_POOL_SIZE connections, the
+GET routes through a separate query_only pool of DB_READ_POOL_SIZE.
+"""
+
+SQLITE_FILE = os.getenv("SQLITE_FILE", "database.db")
+SQLITE_PROFILE = "production"
+SQLITE_PROFILES = {
+    "default": {},
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 5
+DB_READ_POOL_SIZE = 10
+DB_READ_MAX_OVERFLOW = 10
+
+"""
+Vote write config
+
+VOTE_WRITE_MODE: "direct" commits every vote on its own, "group" hands votes
+to a single writer task that commits up to VOTE_GROUP_COMMIT_SIZE votes or
+whatever arrived within VOTE_GROUP_COMMIT_DELAY_SECONDS in one transaction.
+"""
+
+VOTE_WRITE_MODE = "direct"
+VOTE_GROUP_COMMIT_SIZE = 500
+VOTE_GROUP_COMMIT_DELAY_SECONDS = 0.005
+
+"""
+Response cache config
+"""
+
+RESPONSE_CACHE_SIZE = 1024
+
+"""
+Metrics config
+
+Histogram buckets of the request latencies, and of the number and total
+duration of the SQL statements run per request, exposed at `/metrics`.
+"""
+
+METRICS_ENABLED = True
+METRICS_LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+METRICS_STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+"""
+Profiling config
+
+A request carrying `X-Profile: <PROFILING_ADMIN_TOKEN>` runs under cProfile,
+its pstats file and SQL statements are saved to PROFILE_DIR. Profiling is
+off, and costs nothing, while no token is set.
+"""
+
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN")
+PROFILE_DIR = "profiles"
+PROFILE_TOP_FUNCTIONS = 40
+
+"""
+JSON response config
+
+FAST_JSON_RESPONSES serializes the proposal and vote listings straight from
+the selected column tuples, with orjson when it is installed, instead of
+loading ORM objects and validating them through the response model.
+"""
+
+FAST_JSON_RESPONSES = False
+
+"""
+Live results config
+
+Every stream subscribed to a proposal's results buffers up to
+RESULTS_STREAM_QUEUE_SIZE tally changes. A slower client is resynced with a
+fresh snapshot instead. Idle streams send a keepalive comment every
+RESULTS_STREAM_KEEPALIVE_SECONDS.
+"""
+
+RESULTS_STREAM_QUEUE_SIZE = 100
+RESULTS_STREAM_KEEPALIVE_SECONDS = 15.0